@@ -2,29 +2,36 @@
 
 import game
 from dxz import DXZ
-from scipy.sparse import csc_matrix
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 if __name__ == '__main__':
     g = game.GAME()
-    g.enumerate_positions()
-    csc = csc_matrix(g.pieces_pos, dtype='u1')
+    # Find each arrangement of the interchangeable white pieces only once
+    csc, row_to_piece = g.enumerate_positions(canonical=True, cache_dir='.cache')
 
-    start = g.m * g.n + 1
-    stop = g.pieces_pos.shape[1]
-
-    primary_idx = list(range(start, stop))
-    dxz = DXZ(csc, primary_idx=primary_idx)
+    primary_idx = g.primary_idx
+    dxz = DXZ(csc, primary_idx=primary_idx, engine='array', expand=g.expand)
     #dxz.search(log_time=True, log_resources=True, every=60.0)
-    dxz.search(log_time=True, log_resources=False)
-    logger.warning(len(dxz.zdd))
+    # Continue from the last checkpoint if a previous run was killed
+    checkpoint = 'search.ckpt'
+    resume = None
+    if os.path.exists(checkpoint):
+        try:
+            dxz.check_checkpoint(checkpoint)
+            resume = checkpoint
+        except ValueError as e:
+            logger.warning(f"Starting a new search instead of resuming: {e}")
+    dxz.search(log_time=True, log_resources=False, checkpoint=checkpoint,
+               resume=resume)
+    logger.warning(dxz.zdd.count())
 
-    dxz.dump()
-    dxz = DXZ(csc, primary_idx=primary_idx)
+    dxz.dump(binary=True)
+    dxz = DXZ(csc, primary_idx=primary_idx, engine='array', expand=g.expand)
     dxz.load()
-    logger.warning(len(dxz.zdd))
-    #for sol in dxz.solutions:
+    logger.warning(dxz.zdd.count())
+    #for sol in dxz.all_solutions():
     #    print(g.pieces_pos[sol, :])
     #dxz.print_solutions()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import time
+from itertools import product
+import numpy as np
+from scipy.sparse import csr_matrix
+import psutil
+from dlx import DLX
+from dxz import DXZ
+from bitset import BITSET
+from metrics import METRICS
+from heuristic import HEURISTICS
+import game
+
+PENTOMINOES = {
+    'F': [(0, 1), (0, 2), (1, 0), (1, 1), (2, 1)],
+    'I': [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)],
+    'L': [(0, 0), (1, 0), (2, 0), (3, 0), (3, 1)],
+    'N': [(0, 1), (1, 1), (2, 0), (2, 1), (3, 0)],
+    'P': [(0, 0), (0, 1), (1, 0), (1, 1), (2, 0)],
+    'T': [(0, 0), (0, 1), (0, 2), (1, 1), (2, 1)],
+    'U': [(0, 0), (0, 2), (1, 0), (1, 1), (1, 2)],
+    'V': [(0, 0), (1, 0), (2, 0), (2, 1), (2, 2)],
+    'W': [(0, 0), (1, 0), (1, 1), (2, 1), (2, 2)],
+    'X': [(0, 1), (1, 0), (1, 1), (1, 2), (2, 1)],
+    'Y': [(0, 1), (1, 0), (1, 1), (2, 1), (3, 1)],
+    'Z': [(0, 0), (0, 1), (1, 1), (2, 1), (2, 2)],
+}
+
+SUDOKU = '53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79'
+
+def _to_csc(rows, n_cols):
+    """
+    Build a 0/1 csc_matrix from a list of column index lists
+    """
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    indices = np.fromiter((j for row in rows for j in row), dtype=np.int64,
+                          count=indptr[-1])
+    data = np.ones(len(indices), dtype='u1')
+    A = csr_matrix((data, indices, indptr), shape=(len(rows), n_cols))
+
+    return A.tocsc()
+
+def queens(n=8):
+    """
+    N-queens as generalized exact cover. Every rank and file is primary while
+    the 2n-1 diagonals and 2n-1 anti-diagonals are secondary.
+    """
+    rows = []
+    for i in range(n):
+        for j in range(n):
+            rows.append([i, n + j, 2 * n + i + j, 4 * n - 1 + i - j + n - 1])
+
+    return _to_csc(rows, 6 * n - 2), list(range(2 * n))
+
+def pentomino(n=6, m=10):
+    """
+    Pack the 12 pentominoes into an n x m board. Every piece is primary and,
+    when the board has more than 60 cells, the cells are secondary.
+    """
+    rows = []
+    for p, cells in enumerate(PENTOMINOES.values()):
+        shapes = set()
+        for _ in range(2):
+            for _ in range(4):
+                cells = [(c, -r) for r, c in cells]  # Rotate
+                r0 = min(r for r, c in cells)
+                c0 = min(c for r, c in cells)
+                shapes.add(tuple(sorted((r - r0, c - c0) for r, c in cells)))
+            cells = [(r, -c) for r, c in cells]  # Reflect
+        for shape in sorted(shapes):
+            height = max(r for r, c in shape) + 1
+            width = max(c for r, c in shape) + 1
+            for i in range(n - height + 1):
+                for j in range(m - width + 1):
+                    rows.append([p] + [12 + (i + r) * m + j + c for r, c in shape])
+
+    primary_idx = list(range(12)) if n * m > 60 else None
+
+    return _to_csc(rows, 12 + n * m), primary_idx
+
+def sudoku(givens=SUDOKU, box=3):
+    """
+    Sudoku with (box*box) x (box*box) cells, where `givens` lists the cells in
+    row-major order and any character that is not a nonzero digit is blank
+    """
+    n = box * box
+    rows = []
+    for i in range(n):
+        for j in range(n):
+            given = givens[i * n + j] if givens else '.'
+            digits = [int(given) - 1] if given.isdigit() and given != '0' else range(n)
+            for d in digits:
+                b = (i // box) * box + j // box
+                rows.append([i * n + j,
+                             n * n + i * n + d,
+                             2 * n * n + j * n + d,
+                             3 * n * n + b * n + d,
+                            ])
+
+    return _to_csc(rows, 4 * n * n), None
+
+def random_sparse(n_rows=200, n_cols=40, density=0.1, seed=0):
+    """
+    Random matrix with a planted exact cover, so that there is at least one
+    solution
+    """
+    rng = random.Random(seed)
+    cols = list(range(n_cols))
+    rng.shuffle(cols)
+    rows = []
+    i = 0
+    while i < n_cols:
+        k = rng.randint(1, max(1, int(2 / density)))
+        rows.append(sorted(cols[i:i + k]))
+        i += k
+    while len(rows) < n_rows:
+        row = [j for j in range(n_cols) if rng.random() < density]
+        if row:
+            rows.append(row)
+    rng.shuffle(rows)
+
+    return _to_csc(rows, n_cols), None
+
+def avm(n=5, m=5, canonical=False):
+    """
+    The AVM game board from `GAME(n, m)`, where only the pieces are primary.
+    With `canonical`, interchangeable pieces are only counted once per
+    arrangement.
+    """
+    g = game.GAME(n, m)
+    A, row_to_piece = g.enumerate_positions(canonical)
+
+    return A, g.primary_idx
+
+INSTANCES = {
+    'queens': queens,
+    'pentomino': pentomino,
+    'sudoku': sudoku,
+    'random': random_sparse,
+    'avm': avm,
+}
+
+SUITES = {
+    'small': [('queens', {'n': 6}),
+              ('queens', {'n': 8}),
+              ('pentomino', {'n': 3, 'm': 20}),
+              ('sudoku', {}),
+              ('sudoku', {'givens': None, 'box': 2}),
+              ('random', {'n_rows': 200, 'n_cols': 40, 'density': 0.1}),
+              ('avm', {'n': 3, 'm': 3}),
+              ('avm', {'n': 3, 'm': 3, 'canonical': True}),
+             ],
+    'large': [('queens', {'n': 10}),
+              ('queens', {'n': 12}),
+              ('pentomino', {'n': 5, 'm': 12}),
+              ('random', {'n_rows': 2000, 'n_cols': 100, 'density': 0.05}),
+              ('avm', {'n': 3, 'm': 4}),
+              ('avm', {'n': 3, 'm': 4, 'canonical': True}),
+              ('avm', {'n': 4, 'm': 4}),
+              ('avm', {'n': 4, 'm': 4, 'canonical': True}),
+             ],
+}
+
+SOLVERS = {'dlx': DLX, 'dxz': DXZ, 'bitset': BITSET}
+
+ENGINES = ('object', 'array', 'bucket')
+
+def run_case(instance, params, solver, engine, heuristic='mrv'):
+    """
+    Build and search one instance with one solver, matrix engine, and column
+    heuristic, and return the measurements as a dict. The 'bitset' solver
+    has no engine or heuristic to choose.
+    """
+    rss = psutil.Process().memory_info()[0]
+    A, primary_idx = INSTANCES[instance](**params)
+    if solver == 'bitset':
+        s = BITSET(A, primary_idx=primary_idx)
+    else:
+        s = SOLVERS[solver](A, primary_idx=primary_idx, engine=engine,
+                            heuristic=heuristic, seed=0)
+    s.metrics = METRICS()
+
+    start = time.perf_counter()
+    s.matrix
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if solver != 'dxz':
+        n = s.count()
+    else:
+        s.search()
+        n = s.zdd.count()
+    search_time = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    record = {'instance': instance,
+              'params': params,
+              'shape': list(A.shape),
+              'solver': solver,
+              'engine': engine,
+              'heuristic': heuristic,
+              'build_time': build_time,
+              'search_time': search_time,
+              'peak_memory': max(peak - rss, 0) / (1024.0 ** 2),
+              'solutions': n,
+             }
+    record.update(s.metrics.snapshot())
+    if solver == 'dxz':
+        record['memo'] = s.memo_info._asdict()
+        record['zdd_nodes'] = len(s.manager)
+
+    return record
+
+def _run_case(args):
+    return run_case(*args)
+
+def run(suite='small', solvers=SOLVERS, engines=ENGINES, heuristics=('mrv',)):
+    """
+    Returns a generator of the records for every case in `suite`. Each case
+    runs in a fresh process so that its peak memory is not hidden by the
+    cases before it.
+    """
+    for instance, params in SUITES[suite]:
+        for solver in solvers:
+            cases = product(engines, heuristics)
+            if solver == 'bitset':
+                cases = [('bitset', 'mrv')]
+            for engine, heuristic in cases:
+                with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                    args = (instance, params, solver, engine, heuristic)
+                    record = pool.apply(_run_case, (args,))
+                record['python'] = platform.python_version()
+                yield record
+
+def _case(record):
+    return (record['instance'], json.dumps(record['params'], sort_keys=True),
+            record['solver'], record['engine'], record.get('heuristic', 'mrv'))
+
+def compare(baseline, records, threshold=1.2):
+    """
+    Return a list of messages for every case in `records` whose search time
+    is more than `threshold` times the time in `baseline`, or whose number of
+    solutions differs
+    """
+    old = {_case(record): record for record in baseline}
+    messages = []
+    for record in records:
+        prev = old.get(_case(record))
+        if prev is None:
+            continue
+        if prev['solutions'] != record['solutions']:
+            messages.append(f"{_case(record)} solutions {prev['solutions']} -> {record['solutions']}")
+        ratio = record['search_time'] / max(prev['search_time'], 1e-9)
+        if ratio > threshold:
+            messages.append(f"{_case(record)} search_time {prev['search_time']:.3f} -> {record['search_time']:.3f} ({ratio:.2f}x)")
+
+    return messages
+
+def read(path):
+    with open(path) as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exact cover benchmarks')
+    parser.add_argument('--suite', default='small', choices=sorted(SUITES))
+    parser.add_argument('--solvers', nargs='+', default=list(SOLVERS), choices=list(SOLVERS))
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES),
+                        help='Matrix engines for dlx and dxz (bitset has its own)')
+    parser.add_argument('--heuristics', nargs='+', default=['mrv'], choices=list(HEURISTICS))
+    parser.add_argument('--out', default='bench.jsonl', help='JSON lines output file')
+    parser.add_argument('--baseline', help='JSON lines file from an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    records = []
+    with open(args.out, 'w') as fp:
+        for record in run(args.suite, args.solvers, args.engines, args.heuristics):
+            records.append(record)
+            fp.write(json.dumps(record) + '\n')
+            fp.flush()
+            print(f"{record['instance']:<10} {json.dumps(record['params']):<45} "
+                  f"{record['solver']} {record['engine']:<6} {record['heuristic']:<11} "
+                  f"build {record['build_time']:8.3f} s  search {record['search_time']:8.3f} s  "
+                  f"{record['peak_memory']:8.1f} MB  {record['solutions']} solutions  "
+                  f"{sum(record['nodes'])} nodes")
+
+    if args.baseline is not None:
+        for msg in compare(read(args.baseline), records, args.threshold):
+            print(msg)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix
+import time
+
+class BITSET(object):
+    """
+    Exact cover search without any links.
+
+    Each row is a bitmask of its columns, stored as an (n_rows, words) array
+    of uint64 words, and every level of the search keeps the NumPy array of
+    the rows that are still candidates. Choosing a row filters that array
+    with a single AND against the row's mask, so backtracking is simply
+    returning to the parent's array. The column with the fewest candidates
+    is found by summing the dense 0/1 rows of the candidates, which is cheap
+    when there are few columns (e.g., 35 for the default AVM board).
+
+    This accepts the same `A`, `row_labels` and `primary_idx` as `DLX` and
+    offers the same `count`, `iter_solutions` and `search` methods, choosing
+    the leftmost primary column with the fewest candidates (like the 'mrv'
+    heuristic). Multiplicities are not supported.
+    """
+
+    def __init__(self, A, row_labels=None, primary_idx=None):
+        self._A = A
+        self._row_labels = row_labels
+        self._primary_idx = primary_idx
+        self._matrix = None
+        self._dense = None
+        self._primary = None
+        self._start_time = None
+        self._metrics = None
+        self._row_sizes = None
+
+    @property
+    def A(self):
+        return self._A
+
+    @property
+    def matrix(self):
+        """
+        The row bitmasks as an (n_rows, words) uint64 array
+        """
+        if self._matrix is None:
+            A = csr_matrix(self._A)
+            n_rows, n_cols = A.shape
+            dense = (A.toarray() != 0)
+            words = max(1, (n_cols + 63) // 64)
+            bits = np.zeros((n_rows, words * 64), dtype=np.uint8)
+            bits[:, :n_cols] = dense
+            # Little endian bit order so that column j is bit j % 64 of word j // 64
+            packed = np.packbits(bits, axis=1, bitorder='little')
+            self._matrix = packed.view('<u8').astype(np.uint64)
+            self._dense = dense.astype(np.int32)
+            primary = np.zeros(n_cols, dtype=bool)
+            if self._primary_idx is None:
+                primary[:] = True
+            else:
+                primary[list(self._primary_idx)] = True
+            self._primary = primary
+
+        return self._matrix
+
+    @property
+    def metrics(self):
+        """
+        The `METRICS` counters updated by the search, or None (the default)
+        to skip counting
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self._metrics = value
+        if value is not None and self._row_sizes is None:
+            self._row_sizes = self._A.getnnz(axis=1).tolist()
+
+    @property
+    def solutions(self):
+        """
+        Returns a generator for each solution, as a tuple of rows
+        """
+        return self.iter_solutions()
+
+    def iter_solutions(self, limit=None):
+        """
+        Returns a generator for the first `limit` solutions (or all of them
+        when `limit` is None), as tuples of rows
+        """
+        for sol in self._search(limit):
+            if self._row_labels is not None:
+                sol = tuple(self._row_labels[row] for row in sol)
+            yield sol
+
+    def count(self, limit=None):
+        """
+        Return the exact number of solutions (capped at `limit`) without
+        materializing any of them
+        """
+        return sum(self._search(limit, materialize=False))
+
+    def _choose(self, live, open_):
+        """
+        Return the open primary column with the fewest candidates among
+        `live` and that number
+        """
+        counts = self._dense[live].sum(axis=0)
+        counts[~open_] = np.iinfo(counts.dtype).max
+        c = int(np.argmin(counts))
+
+        return c, int(counts[c])
+
+    def _search(self, limit=None, materialize=True):
+        """
+        Depth-first search over an explicit stack that holds, for each level,
+        the candidate rows of the chosen column, the index of the one being
+        tried, the open primary columns, and the live rows. Yields each
+        exact cover as a tuple of rows or, with `materialize=False`, the
+        number of new solutions, counting the rows of the last open column
+        at once.
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        masks = self.matrix
+        dense = self._dense
+        metrics = self._metrics
+        sizes = self._row_sizes
+        if metrics is not None:
+            metrics.reset()
+        self._start_time = time.time()
+
+        live = np.arange(masks.shape[0])
+        open_ = self._primary.copy()
+        levels = []
+        path = []
+        found = 0
+
+        def push(live, open_):
+            # Returns the number of solutions found at this node (if any)
+            n_open = int(open_.sum())
+            if n_open == 0:
+                return 1
+            c, n = self._choose(live, open_)
+            if n == 0:
+                return 0
+            rows = live[dense[live, c] != 0]
+            if not materialize and n_open == 1:
+                # Every row of the last column is a branch, as in `DLX`
+                if metrics is not None:
+                    metrics.visit(len(levels), 0, n)
+                return n
+            levels.append([rows, 0, open_, live])
+            return None
+
+        n = push(live, open_)
+        if n:
+            if metrics is not None:
+                metrics.solutions += n
+            if limit is not None:
+                n = min(n, limit)
+            yield tuple(path) if materialize else n
+            return
+
+        while levels:
+            level = levels[-1]
+            rows, index, open_, live = level
+            if index == len(rows):
+                levels.pop()
+                continue
+
+            r = int(rows[index])
+            level[1] = index + 1
+            del path[len(levels) - 1:]
+            path.append(r)
+            if metrics is not None:
+                metrics.visit(len(levels) - 1, sizes[r])
+
+            # Drop every live row that shares a column with `r`
+            clash = np.any(masks[live] & masks[r], axis=1)
+            n = push(live[~clash], open_ & (dense[r] == 0))
+            if n:
+                if metrics is not None:
+                    metrics.solutions += n
+                if materialize:
+                    if limit is not None and found >= limit:
+                        return
+                    yield tuple(path)
+                    found += 1
+                else:
+                    if limit is not None:
+                        n = min(n, limit - found)
+                    yield n
+                    found += n
+                if limit is not None and found >= limit:
+                    return
+
+    def search(self, limit=None, print_flag=True):
+        """
+        Print the first `limit` solutions (or all of them when `limit` is
+        None) and return the number of solutions found
+        """
+        if not print_flag:
+            return self.count(limit)
+
+        n = 0
+        for sol in self.iter_solutions(limit):
+            n += 1
+            print(list(sol))
+
+        return n
+
+if __name__ == "__main__":
+    # Knuth Example
+    arr = np.array([[0, 0, 1, 0, 1, 1, 0],
+                    [1, 0, 0, 1, 0, 0, 1],
+                    [0, 1, 1, 0, 0, 1, 0],
+                    [1, 0, 0, 1, 0, 0, 0],
+                    [0, 1, 0, 0, 0, 0, 1],
+                    [0, 0, 0, 1, 1, 0, 1]
+                   ], dtype='u1')
+
+    csc = csc_matrix(arr)
+
+    bitset = BITSET(csc)
+    bitset.search()
+
+    # A `limit` caps the solutions found, down to none at all
+    for limit in (0, 1, 2, None):
+        n = bitset.count()
+        n = n if limit is None else min(limit, n)
+        assert bitset.count(limit) == len(list(bitset.iter_solutions(limit))) == n
+        assert bitset.search(limit, print_flag=False) == n
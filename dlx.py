@@ -1,74 +1,656 @@
 #!/usr/bin/env python
 
-from matrix import MATRIX
+from matrix import get_engine
+from heuristic import get_heuristic
+import parallel
+import givens
+import estimate
+from metrics import METRICS, SAMPLER
 import numpy as np
-from scipy.sparse import csc_matrix
-from collections import deque
+from scipy.sparse import csc_matrix, csr_matrix
+from functools import partial
+import time
+import random
 
 class DLX(object):
-    def __init__(self, A, row_labels=None, primary_idx=None):
+    def __init__(self, A, row_labels=None, primary_idx=None, engine='object',
+                 heuristic='mrv', seed=None, expand=None, multiplicities=None):
         self._A = A
         self._row_labels = row_labels
         self._primary_idx = primary_idx
+        self._multiplicities = multiplicities
+        self._engine_name = engine
+        self._engine = get_engine(engine)
+        self._heuristic_name = heuristic
+        self._heuristic = get_heuristic(heuristic)
+        self._seed = seed
+        self._rng = random.Random(seed)  # Used by randomized heuristics
+        self._expand = expand  # Maps a canonical solution to its orbit
         self._matrix = None
+        self._levels = []  # (index, degree) of the row tried at each level
+        self._progress = None  # Completed fraction once the last search stopped
+        self._start_time = None
+        self._metrics = None
+        self._row_sizes = None
+        self._bounds = None  # (lo, hi) for each primary column header
+        self._counts = None  # Rows chosen so far for each primary column header
+        self._A_csr = None
 
     @property
     def A(self):
         return self._A
 
+    @property
+    def _csr(self):
+        """
+        `A` as a csr_matrix for looking up the columns of a row
+        """
+        if self._A_csr is None:
+            self._A_csr = csr_matrix(self._A)
+
+        return self._A_csr
+
     @property
     def matrix(self):
         if self._matrix is None:
-            self._matrix = MATRIX(self._A,
-                                  self._primary_idx,
-                                 )
+            self._matrix = self._engine(self._A,
+                                        self._primary_idx,
+                                        multiplicities=self._multiplicities,
+                                       )
+            if self._multiplicities is not None:
+                m = self._matrix
+                self._bounds = {c: self._multiplicities.get(m.N(c), (1, 1))
+                                for c in m.sweep(m.h, 'R')}
+                self._counts = dict.fromkeys(self._bounds, 0)
 
         return self._matrix
 
+    @property
+    def metrics(self):
+        """
+        The `METRICS` counters updated by the search, or None (the default)
+        to skip counting
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self._metrics = value
+        if value is not None and self._row_sizes is None:
+            self._row_sizes = self._A.getnnz(axis=1).tolist()
+
+    def snapshot(self):
+        """
+        Return the current state of the search as a dict
+        """
+        snapshot = {'progress': self.progress, 'eta': self.eta}
+        if self._metrics is not None:
+            snapshot.update(self._metrics.snapshot())
+
+        return snapshot
+
+    def sample(self, every=60.0, path=None, callback=None):
+        """
+        Return a `SAMPLER` of `snapshot`, attaching `METRICS` if needed
+        """
+        if self._metrics is None:
+            self.metrics = METRICS()
+
+        return SAMPLER(self.snapshot, every, path, callback)
+
     def _choose_column(self):
-        S = np.inf
-        for j in self.matrix.h.sweep('R'):
-            if j.S < S:
-                col = j
-                S = j.S
+        return self._heuristic(self.matrix, self._rng)
 
-        return col
+    def _choose_item(self):
+        """
+        Return the active primary column with the fewest ways to branch (as
+        in Knuth's Algorithm M), the number of rows that it still needs, and
+        that number of ways. A column that still needs `k` rows can only
+        start with one of its first `S - k + 1` rows, since its rows are
+        chosen in order, while one that needs none can also be closed.
+        """
+        m = self.matrix
+        best = None
+        for c in m.sweep(m.h, 'R'):
+            lo, hi = self._bounds[c]
+            need = max(lo - self._counts[c], 0)
+            theta = m.S(c) + 1 - need
+            if best is None or theta < best[2]:
+                best = (c, need, theta)
+                if theta <= 0:
+                    break
 
-    def search(self, k=0, partials=None, level=0, print_flag=True):
-        if partials is None:
-            partials = deque()
+        return best
 
-        if self.matrix.h.R == self.matrix.h:
-            if len(partials) == 0:
-                print("Your matrix is empty!")
+    def _pick(self, r):
+        """
+        Choose the row of node `r` when the matrix has multiplicities. The
+        row is hidden so that it cannot be chosen twice, secondary columns are
+        covered, and primary columns are covered once they reach their upper
+        bound.
+        """
+        m = self.matrix
+        bounds, counts = self._bounds, self._counts
+        m.hide(r)
+        for j in [r, *m.sweep(r, 'R')]:
+            c = m.column(j)
+            if c in bounds:
+                counts[c] += 1
+                if counts[c] == bounds[c][1]:
+                    m.cover(c)
             else:
-                if not print_flag:
-                    return 
-                if self._row_labels is not None:
-                    sol = [self._row_labels[row] for row in partials]
-                    print(sol)
-                else:
-                    print(list(partials))
+                m.cover(c)
+
+    def _unpick(self, r):
+        """
+        Undo `_pick`
+        """
+        m = self.matrix
+        bounds, counts = self._bounds, self._counts
+        for j in [*m.sweep(r, 'L'), r]:
+            c = m.column(j)
+            if c in bounds:
+                if counts[c] == bounds[c][1]:
+                    m.uncover(c)
+                counts[c] -= 1
+            else:
+                m.uncover(c)
+        m.unhide(r)
+
+    def _branches(self):
+        """
+        Return the branches of the search at the current node as (do, undo)
+        pairs of calls that change the matrix the way `_search` does, or
+        None when every primary column is covered (a solution). With
+        multiplicities, branch `k` hides the first `k` rows of the column
+        before picking the next one, and the last branch may close it.
+        """
+        m = self.matrix
+        if m.R(m.h) == m.h:
+            return None
+
+        if self._bounds is None:
+            c = self._choose_column()
+            rows = [m.row(r) for r in m.sweep(c, 'D')]
+            return [(partial(self._cover_row, row), partial(self._uncover_row, row))
+                    for row in rows]
+
+        c, need, theta = self._choose_item()
+        if theta <= 0:
+            return []
+        rows = list(m.sweep(c, 'D'))
+        branches = [(partial(self._enter, c, rows[:k], rows[k]), partial(self._leave, c, rows[:k], rows[k]))
+                    for k in range(theta if need > 0 else len(rows))]
+        if need == 0:
+            branches.append((partial(self._enter, c, rows, None), partial(self._leave, c, rows, None)))
+
+        return branches
+
+    def _enter(self, c, hidden, r):
+        """
+        Hide the rows in `hidden`, then pick the row of node `r` or, when it
+        is None, close column `c`
+        """
+        m = self.matrix
+        for x in hidden:
+            m.hide(x)
+        if r is None:
+            m.cover(c)
+        else:
+            self._pick(r)
+
+    def _leave(self, c, hidden, r):
+        """
+        Undo `_enter`
+        """
+        m = self.matrix
+        if r is None:
+            m.uncover(c)
+        else:
+            self._unpick(r)
+        for x in reversed(hidden):
+            m.unhide(x)
+
+    def _cover_row(self, row):
+        """
+        Cover every column of `row`, as if it had been chosen by the search
+        """
+        m = self.matrix
+        r = m.row_node(row)
+        if self._bounds is not None:
+            self._pick(r)
+            return
+        m.cover(m.column(r))
+        for j in m.sweep(r, 'R'):
+            m.cover(m.column(j))
+
+    def _uncover_row(self, row):
+        """
+        Undo `_cover_row`
+        """
+        m = self.matrix
+        r = m.row_node(row)
+        if self._bounds is not None:
+            self._unpick(r)
+            return
+        for j in m.sweep(r, 'L'):
+            m.uncover(m.column(j))
+        m.uncover(m.column(r))
+
+    def _cover_rows(self, rows):
+        for row in rows:
+            self._cover_row(row)
+
+    def _uncover_rows(self, rows):
+        for row in reversed(rows):
+            self._uncover_row(row)
+
+    def _worker_args(self):
+        """
+        Arguments for rebuilding this solver in a worker process
+        """
+        return DLX, self._A, {'primary_idx': self._primary_idx,
+                              'multiplicities': self._multiplicities,
+                              'engine': self._engine_name,
+                              'heuristic': self._heuristic_name,
+                              'seed': self._seed,
+                             }
+
+    @property
+    def solutions(self):
+        """
+        Returns a generator for each solution, as a tuple of rows
+        """
+        return self.iter_solutions()
+
+    def iter_solutions(self, limit=None, processes=None, depth=1):
+        """
+        Returns a generator for the first `limit` solutions (or all of them
+        when `limit` is None), as tuples of rows.
+
+        When `processes` is given, the branches `depth` levels below the root
+        are searched on a pool of that many worker processes and solutions
+        arrive in the order that their branches finish.
+        """
+        if processes is None:
+            sols = self._search(limit)
+        else:
+            self._check_parallel()
+            sols = self._parallel_search(limit, processes, depth)
+
+        for sol in sols:
+            yield self._label(sol)
+
+    def all_solutions(self, limit=None, processes=None, depth=1):
+        """
+        Same as `iter_solutions` except that every solution found is passed
+        through `expand` (e.g., `GAME.expand` for a matrix built with
+        `canonical=True`) to recover all of the solutions that are
+        equivalent to it
+        """
+        if self._expand is None or limit == 0:
+            yield from self.iter_solutions(limit, processes, depth)
+            return
+
+        if processes is None:
+            sols = self._search()
+        else:
+            self._check_parallel()
+            sols = self._parallel_search(None, processes, depth)
+
+        found = 0
+        try:
+            for sol in sols:
+                for full in self._expand(sol):
+                    yield self._label(tuple(full))
+                    found += 1
+                    if found == limit:
+                        return
+        finally:
+            sols.close()
+
+    def _check_parallel(self):
+        if self._multiplicities is not None:
+            raise ValueError("`processes` is not supported with multiplicities")
+
+    def _label(self, sol):
+        if self._row_labels is not None:
+            sol = tuple(self._row_labels[row] for row in sol)
+
+        return sol
+
+    def _parallel_search(self, limit, processes, depth):
+        if limit == 0:
             return
 
-        c = self._choose_column()
-        self.matrix.cover(c)
-        for r in c.sweep('D'):
-            Ok = r
-            partials.append(r.row)  # r is included in partial solution
-            for j in r.sweep('R'):
-                self.matrix.cover(j.column)
-            self.search(k+1, partials, level+1, print_flag)
-            r = Ok
-            c = r.column
-            for j in r.sweep('L'):
-                self.matrix.uncover(j.column)
-
-            if len(partials) > 0:
-                partials.pop()
-        self.matrix.uncover(c)
-
-        return
+        task = partial(parallel.solve_branch, limit=limit)
+        found = 0
+        for prefix, sols in parallel.run(self, task, processes, depth):
+            for sol in sols:
+                yield prefix + sol
+                found += 1
+                if found == limit:
+                    return
+
+    def _search(self, limit=None, materialize=True):
+        """
+        Depth-first search over an explicit stack of (column, row) choices
+        instead of one recursive call per level. Each exact cover is yielded
+        as a tuple of row indices while the search is suspended, and the
+        matrix is restored even if the generator is closed early.
+
+        With `materialize=False` no solution tuples are built. Instead, the
+        number of new solutions is yielded and, when only one column is left,
+        all of its rows are counted at once without descending another level.
+        The search stops as soon as `limit` solutions have been found.
+        """
+        if limit == 0:
+            return
+
+        m = self.matrix
+        if self._bounds is not None:
+            yield from self._search_mcc(limit, materialize)
+            return
+
+        h = m.h
+        cols = []  # Column chosen at each level
+        nodes = []  # Row (node) currently tried in that column
+        levels = self._levels = []
+        self._progress = None
+        self._start_time = time.time()
+        metrics = self._metrics
+        sizes = self._row_sizes
+        if metrics is not None:
+            metrics.reset()
+        found = 0
+        backtrack = False
+        try:
+            while True:
+                if not backtrack:
+                    if m.R(h) == h:
+                        found += 1
+                        if metrics is not None:
+                            metrics.solutions += 1
+                        yield tuple(m.row(r) for r in nodes) if materialize else 1
+                        if found == limit:
+                            return
+                        backtrack = True
+                    else:
+                        c = self._choose_column()
+                        if not materialize and m.R(c) == h and m.L(c) == h:
+                            # Every row in the last column completes a cover
+                            n = m.S(c)
+                            if limit is not None:
+                                n = min(n, limit - found)
+                            if n > 0:
+                                found += n
+                                if metrics is not None:
+                                    metrics.visit(len(nodes), 0, n)
+                                    metrics.solutions += n
+                                yield n
+                                if found == limit:
+                                    return
+                            backtrack = True
+                        else:
+                            index, degree = 0, m.S(c)
+                            m.cover(c)
+                            if metrics is not None:
+                                metrics.covers += 1
+                            r = m.D(c)
+
+                if backtrack:
+                    if not nodes:
+                        return
+                    c = cols.pop()
+                    r = nodes.pop()
+                    index, degree = levels.pop()
+                    index += 1
+                    for j in m.sweep(r, 'L'):
+                        m.uncover(m.column(j))
+                    if metrics is not None:
+                        metrics.uncovers += sizes[m.row(r)] - 1
+                    r = m.D(r)
+
+                if r == c:
+                    # All rows in this column have been tried
+                    m.uncover(c)
+                    if metrics is not None:
+                        metrics.uncovers += 1
+                    backtrack = True
+                    continue
+
+                if metrics is not None:
+                    metrics.visit(len(nodes), sizes[m.row(r)] - 1)
+                cols.append(c)
+                nodes.append(r)  # r is included in partial solution
+                levels.append((index, degree))
+                for j in m.sweep(r, 'R'):
+                    m.cover(m.column(j))
+                backtrack = False
+        finally:
+            self._stopped()
+            while nodes:
+                c = cols.pop()
+                r = nodes.pop()
+                levels.pop()
+                for j in m.sweep(r, 'L'):
+                    m.uncover(m.column(j))
+                m.uncover(c)
+
+    def _search_mcc(self, limit=None, materialize=True):
+        """
+        Same as `_search` for a matrix with multiplicities, following Knuth's
+        Algorithm M. Each level branches on the column from `_choose_item`
+        by trying its rows in order, hiding every row that was already tried
+        so that the rows of a column are always chosen in increasing order
+        and each solution is found once, and finally (when the column needs
+        no more rows) by closing the column.
+
+        Each level of the explicit stack is [column, row node, rows left to
+        try, hidden rows, may close, state] where the state is 0 before the
+        first branch, 1 while a row is chosen, and 2 once the column is
+        closed.
+        """
+        m = self.matrix
+        h = m.h
+        metrics = self._metrics
+        if metrics is not None:
+            metrics.reset()
+        progress = self._levels = []  # [index, degree] of the branch tried at each level
+        self._progress = None
+        self._start_time = time.time()
+        levels = []
+        path = []  # Row nodes in the partial solution
+        found = 0
+        descend = True
+        try:
+            while True:
+                if descend:
+                    descend = False
+                    if m.R(h) == h:
+                        found += 1
+                        if metrics is not None:
+                            metrics.solutions += 1
+                        yield tuple(m.row(r) for r in path) if materialize else 1
+                        if found == limit:
+                            return
+                    else:
+                        c, need, theta = self._choose_item()
+                        if theta > 0:
+                            n_rows = theta if need > 0 else m.S(c)
+                            levels.append([c, m.D(c), n_rows, [], need == 0, 0])
+                            progress.append([-1, n_rows + (need == 0)])
+
+                if not levels:
+                    return
+
+                level = levels[-1]
+                c, r, n_rows, hidden, may_close, state = level
+                if state == 1:
+                    # Exclude the row that was just tried from later branches
+                    path.pop()
+                    self._unpick(r)
+                    m.hide(r)
+                    hidden.append(r)
+                    r = level[1] = m.D(r)
+                elif state == 2:
+                    m.uncover(c)
+
+                if state != 2 and n_rows > 0:
+                    level[2] = n_rows - 1
+                    level[5] = 1
+                    progress[-1][0] += 1
+                    if metrics is not None:
+                        metrics.visit(len(path), 0)
+                    self._pick(r)
+                    path.append(r)
+                    descend = True
+                elif state != 2 and may_close:
+                    level[5] = 2
+                    progress[-1][0] += 1
+                    m.cover(c)
+                    descend = True
+                else:
+                    for r in reversed(hidden):
+                        m.unhide(r)
+                    levels.pop()
+                    progress.pop()
+        finally:
+            self._stopped()
+            while levels:
+                progress.pop()
+                c, r, n_rows, hidden, may_close, state = levels.pop()
+                if state == 1:
+                    path.pop()
+                    self._unpick(r)
+                elif state == 2:
+                    m.uncover(c)
+                for r in reversed(hidden):
+                    m.unhide(r)
+
+    def estimate(self, probes=100, seed=None):
+        """
+        Monte Carlo estimate of the number of search nodes and solutions
+        below the current state (see `estimate.estimate`). This may be called
+        before a search or while a `solutions` generator is suspended.
+        """
+        return estimate.estimate(self, probes, seed)
+
+    def _stopped(self):
+        """
+        Keep the completed fraction of a search that has stopped, before its
+        levels are unwound. A search that ran out of branches left none, so
+        it is complete.
+        """
+        self._progress = estimate.progress(self._levels) if self._levels else 1.0
+
+    @property
+    def progress(self):
+        """
+        Completed fraction of the current (or last) search
+        """
+        if self._progress is not None:
+            return self._progress
+
+        return estimate.progress(self._levels)
+
+    @property
+    def eta(self):
+        """
+        Estimated number of seconds left in the current search
+        """
+        if self._start_time is None:
+            return None
+
+        return estimate.eta(time.time() - self._start_time, self.progress)
+
+    def count(self, limit=None, processes=None, depth=1):
+        """
+        Return the exact number of solutions (capped at `limit`) without
+        materializing any of them. See `iter_solutions` for `processes` and
+        `depth`.
+        """
+        if processes is None:
+            return sum(self._search(limit, materialize=False))
+
+        self._check_parallel()
+        task = partial(parallel.count_branch, limit=limit)
+        n = 0
+        for prefix, branch_n in parallel.run(self, task, processes, depth):
+            n += branch_n
+            if limit is not None and n >= limit:
+                return limit
+
+        return n
+
+    def stream(self, sink, limit=None, processes=None, depth=1, expand=False):
+        """
+        Write the first `limit` solutions (or all of them) to `sink` (see
+        `sink.SINK`), which formats and writes them on its own thread, and
+        return the number written. With `expand`, `all_solutions` is used
+        instead of `iter_solutions`.
+        """
+        sols = self.all_solutions if expand else self.iter_solutions
+        n = 0
+        for sol in sols(limit, processes, depth):
+            sink.write(sol)
+            n += 1
+
+        return n
+
+    def count_givens(self, rows, limit=None):
+        """
+        Return the number of solutions (capped at `limit`) that contain the
+        given `rows`. See `batch`.
+        """
+        return self.batch([rows], limit=limit)[0]
+
+    def solve_givens(self, rows, limit=None):
+        """
+        Return the list of the first `limit` solutions that contain the given
+        `rows`. See `batch`.
+        """
+        return self.batch([rows], count=False, limit=limit)[0]
+
+    def batch(self, batch, count=True, limit=None):
+        """
+        For every list of given rows in `batch` (e.g., the placements fixed
+        by a challenge card), return the number of solutions that contain
+        them or, with `count=False`, the list of those solutions (givens
+        first). The givens are covered on this solver's matrix, which is
+        only built once, and lists that share rows share their covers (see
+        `givens.walk`). Conflicting givens have no solutions.
+        """
+        results = [None] * len(batch)
+        for i, rows in givens.walk(self, batch):
+            if rows is None:
+                results[i] = 0 if count else []
+            elif count:
+                results[i] = sum(self._search(limit, materialize=False))
+            else:
+                results[i] = [self._label(rows + sol) for sol in self._search(limit)]
+
+        return results
+
+    def search(self, limit=None, print_flag=True, processes=None, depth=1):
+        """
+        Print the first `limit` solutions (or all of them when `limit` is
+        None) and return the number of solutions found. This is a thin
+        wrapper around `iter_solutions` and, when `print_flag` is False,
+        around `count`.
+        """
+        if not print_flag:
+            return self.count(limit, processes, depth)
+
+        n = 0
+        for sol in self.iter_solutions(limit, processes, depth):
+            n += 1
+            if len(sol) == 0:
+                print("Your matrix is empty!")
+            else:
+                print(list(sol))
+
+        return n
 
 if __name__ == "__main__":
     # Simple Example
@@ -85,6 +667,8 @@ if __name__ == "__main__":
     #dlx = DLX(csc, primary_idx=[1,2])
     dlx = DLX(csc)
     dlx.search()
+    dlx = DLX(csc, engine='array')
+    dlx.search()
     
     # Knuth Example
     arr = np.array([[0, 0, 1, 0, 1, 1, 0],
@@ -144,6 +728,12 @@ if __name__ == "__main__":
     dlx = DLX(csc, primary_idx=pieces.keys())
     dlx.search()
 
+    # A `limit` caps the solutions found, down to none at all
+    for limit in (0, 1, 2, None):
+        n = dlx.count()
+        n = n if limit is None else min(limit, n)
+        assert dlx.count(limit) == len(list(dlx.iter_solutions(limit))) == n
+
     # Generalized Cover Example #2
     # 3x3 grid with one L-shaped, one (2x2) Square-shaped, and one 
     # Singleton-shaped piece.
@@ -1,37 +1,86 @@
 #!/usr/bin/env python
 
-from matrix import MATRIX
+from matrix import get_engine
+from heuristic import get_heuristic
 import numpy as np
-from scipy.sparse import csc_matrix
-from fastcache import lru_cache
-from bitarray import bitarray
-from graphillion import GraphSet
-from itertools import combinations, chain
+from scipy.sparse import csc_matrix, csr_matrix
+from memo import MEMO
+from zdd import ZDD, MAPPED_ZDD, FAMILY, FORMAT_MAGIC
+import parallel
+import givens
+import estimate
+from metrics import METRICS, SAMPLER
+from functools import partial
+import random
 import time
 import logging
-import threading
 import os
-import psutil
 import pickle
+import hashlib
+from array import array
 
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_VERSION = 1
+
 class DXZ(object):
-    def __init__(self, A, row_labels=None, primary_idx=None):
+    def __init__(self, A, row_labels=None, primary_idx=None, engine='object',
+                 memo_entries=None, memo_bytes=None, memo_policy='lru',
+                 heuristic='mrv', seed=None, expand=None, multiplicities=None):
         self._A = A
         self._row_labels = row_labels
+        self._label_rows = None  # Row of each row label, built by `_rows`
         self._primary_idx = primary_idx
+        self._multiplicities = multiplicities
+        self._engine_name = engine
+        self._engine = get_engine(engine)
+        self._heuristic_name = heuristic
+        self._heuristic = get_heuristic(heuristic)
+        self._seed = seed
+        self._rng = random.Random(seed)  # Used by randomized heuristics
+        self._expand = expand  # Maps a canonical solution to its orbit
         self._matrix = None
-        self._universe = None
-        self._zdd = None
-        self._bitarray = None
+        self._memo_args = (memo_entries, memo_bytes, memo_policy)
+        self._manager = ZDD()
+        self._zdd = ZDD.EMPTY  # Root node of the solution family
+        self._zobrist = None
+        self._key = 0  # Zobrist hash of the covered columns
+        self._signature = 0  # Bitmask of the covered columns
+        self._count = None  # Solutions of the last subproblem from `_search`, if known
+        self._memo = MEMO(memo_entries, memo_bytes, memo_policy, self._manager.count)
         self._pid = os.getpid()
         self._search_incomplete = False 
+        self._nodes = 0  # Number of subproblems that were searched
+        self._frontier = []  # [column, row, partial zdd, index, degree] per level
+        self._start_time = None
+        self._progress = None  # Completed fraction once the last search stopped
+        self._metrics = None
+        self._bounds = None  # (lo, hi) for each primary column header
+        self._counts = None  # Rows chosen so far for each primary column header
+        self._A_csr = None
+        self._count_zobrist = None
+        self._row_zobrist = None
+        self._resume = []  # Frontier levels still to be restored on resume
+        self._checkpoint = None
+        self._checkpoint_every = None
+        self._checkpoint_nodes = None
+        self._next_checkpoint_time = None
+        self._next_checkpoint_nodes = None
 
     @property
     def A(self):
         return self._A
 
+    @property
+    def _csr(self):
+        """
+        `A` as a csr_matrix for looking up the columns of a row
+        """
+        if self._A_csr is None:
+            self._A_csr = csr_matrix(self._A)
+
+        return self._A_csr
+
     @property
     def primary_idx(self):
         return self._primary_idx
@@ -39,43 +88,120 @@ class DXZ(object):
     @property
     def matrix(self):
         if self._matrix is None:
-            self._matrix = MATRIX(self._A,
-                                  self._primary_idx,
-                                 )
+            self._matrix = self._engine(self._A,
+                                        self._primary_idx,
+                                        multiplicities=self._multiplicities,
+                                       )
+            if self._multiplicities is not None:
+                self._init_multiplicities()
 
         return self._matrix
 
-    @property
-    def universe(self):
-        if self._universe is None:
-            n = self.matrix.A.shape[0]
-            vertices = list(range(n))
-            vertices.append(-1)  # Terminal zdd Truth node
-            self._universe = list(combinations(vertices, 2))
+    def _init_multiplicities(self):
+        """
+        Set up the bounds and counts of the primary columns along with the
+        Zobrist values for the parts of a subproblem that the covered columns
+        no longer determine: how many rows were chosen for each column that
+        can take more than one, and which chosen rows only contain such
+        columns (nothing else keeps them from being chosen again)
+        """
+        m = self._matrix
+        self._bounds = {c: self._multiplicities.get(m.N(c), (1, 1))
+                        for c in m.sweep(m.h, 'R')}
+        self._counts = dict.fromkeys(self._bounds, 0)
+        rng = random.Random(-self.A.shape[1])
+        self._count_zobrist = {c: [rng.getrandbits(64) for _ in range(hi + 1)]
+                               for c, (lo, hi) in self._bounds.items() if hi > 1}
+        self._row_zobrist = {}
+        for row in range(self.A.shape[0]):
+            r = m.row_node(row)
+            if r is not None and all(m.column(j) in self._count_zobrist
+                                     for j in [r, *m.sweep(r, 'R')]):
+                self._row_zobrist[row] = rng.getrandbits(64)
 
-        return self._universe
+    @property
+    def manager(self):
+        """
+        The ZDD node manager owned by this instance
+        """
+        return self._manager
 
     @property
     def zdd(self):
-        if self._zdd is None:
-            GraphSet.set_universe(self.universe)
-            self._zdd = GraphSet()
-
-        return self._zdd
+        return FAMILY(self._manager, self._zdd)
 
     @zdd.setter
     def zdd(self, value):
-        self._zdd = value
+        self._zdd = value.root
+
+    def _writable(self):
+        """
+        Import a memory mapped zdd (see `load`) into a new `ZDD` the first
+        time that new nodes are needed. The memo is restarted along with it
+        since its entries belong to the previous node manager.
+        """
+        if isinstance(self._manager, MAPPED_ZDD):
+            mapped = self._manager
+            self._manager = ZDD()
+            self._zdd = self._manager.from_arrays(*mapped.to_arrays(self._zdd))
+            self._memo = MEMO(*self._memo_args, self._manager.count)
 
     @property
-    def bitarray(self):
-        if self._bitarray is None:
-            n = self._matrix.A.shape[0]
-            m = self._matrix.A.shape[1]
-            self._bitarray = bitarray(n*m, endian='little')
-            self._bitarray.setall(0)
+    def zobrist(self):
+        """
+        Random 64-bit value for each column that is XOR'd into the memo key
+        whenever the column is covered or uncovered
+        """
+        if self._zobrist is None:
+            rng = random.Random(self.A.shape[1])
+            self._zobrist = [rng.getrandbits(64) for _ in range(self.A.shape[1])]
+
+        return self._zobrist
+
+    @property
+    def memo(self):
+        return self._memo
+
+    @property
+    def memo_info(self):
+        return self._memo.info
+
+    @property
+    def metrics(self):
+        """
+        The `METRICS` counters updated by the search, or None (the default)
+        to skip counting
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self._metrics = value
 
-        return self._bitarray
+    def snapshot(self):
+        """
+        Return the current state of the search as a dict
+        """
+        eta = self.eta
+        snapshot = {'progress': self.progress,
+                    'eta': eta,
+                    'subproblems': self._nodes,
+                    'memo': self.memo_info._asdict(),
+                    'zdd_nodes': len(self._manager),
+                   }
+        if self._metrics is not None:
+            snapshot.update(self._metrics.snapshot())
+
+        return snapshot
+
+    def sample(self, every=60.0, path=None, callback=None):
+        """
+        Return a `SAMPLER` of `snapshot`, attaching `METRICS` if needed
+        """
+        if self._metrics is None:
+            self._metrics = METRICS()
+
+        return SAMPLER(self.snapshot, every, path, callback)
 
     @property
     def pid(self):
@@ -94,10 +220,8 @@ class DXZ(object):
         """
         Returns a generator for each solution stored in the zdd
         """
-        for x in iter(self.zdd):
-            sol = set(chain(*x))
-            sol.remove(-1)  # Remove terminal zdd Truth node
-            sol = list(sol)
+        for x in self.zdd:
+            sol = list(x)
             if self._row_labels is not None:
                 sol = [self._row_labels[row] for row in sol]
             try:
@@ -105,99 +229,747 @@ class DXZ(object):
             except StopIteration:
                 return
 
-    def _choose_column(self):
-        S = np.inf
-        for j in self.matrix.h.sweep('R'):
-            if j.S < S:
-                col = j
-                S = j.S
+    def _labels(self, rows):
+        if self._row_labels is None:
+            return list(rows)
 
-        return col
+        return [self._row_labels[row] for row in rows]
+
+    def _rows(self, labels):
+        """
+        Inverse of `_labels`, for `row_labels` given either as a sequence or
+        as a `{row: label}` dict
+        """
+        if self._row_labels is None:
+            return list(labels)
+
+        if self._label_rows is None:
+            labels_ = self._row_labels
+            items = labels_.items() if isinstance(labels_, dict) else enumerate(labels_)
+            self._label_rows = {label: row for row, label in items}
+        try:
+            return [self._label_rows[label] for label in labels]
+        except KeyError as e:
+            raise ValueError(f"{e.args[0]!r} is not a row label")
+
+    def unrank(self, i):
+        """
+        Return solution `i` in the order of `solutions` in time proportional
+        to the depth of the zdd (rather than to `i`)
+        """
+        return self._labels(self.zdd.unrank(i))
+
+    def rank(self, solution):
+        """
+        Return the index of `solution` (rows, or row labels when `row_labels`
+        was given) in the order of `solutions`, or raise a ValueError if it
+        is not a solution
+        """
+        return self.zdd.rank(self._rows(solution))
+
+    def query(self, required=(), forbidden=(), any_of=()):
+        """
+        Return the `FAMILY` of solutions that contain every row in
+        `required`, no row in `forbidden`, and at least one row from each
+        collection of rows in `any_of` (e.g., the rows from
+        `GAME.rows_covering`). The family is cut out of the zdd from
+        `search`, so it is found without searching again and supports
+        `count`, iteration, `sample` and `unrank`. Rows are given as row
+        labels when `row_labels` was given, as in `rank`.
+        """
+        self._writable()
+        return self.zdd.restrict(self._rows(required), self._rows(forbidden),
+                                 [self._rows(group) for group in any_of])
+
+    def sample_solutions(self, k, seed=None):
+        """
+        Return `k` distinct solutions drawn uniformly at random (see
+        `ZDD.sample`). With `expand`, these are drawn from the canonical
+        solutions that the zdd stores, which are not uniform over the full
+        orbits.
+        """
+        return [self._labels(sol) for sol in self.zdd.sample(k, seed)]
+
+    def all_solutions(self):
+        """
+        Returns a generator for each solution stored in the zdd along with
+        every solution that `expand` (e.g., `GAME.expand` for a matrix built
+        with `canonical=True`) says is equivalent to it
+        """
+        if self._expand is None:
+            yield from self.solutions
+            return
+
+        for x in self.zdd:
+            for full in self._expand(x):
+                sol = list(full)
+                if self._row_labels is not None:
+                    sol = [self._row_labels[row] for row in sol]
+                yield sol
+
+    def _choose_column(self):
+        return self._heuristic(self.matrix, self._rng)
     
-    def memo_cache(self):
-        c = self._choose_column()
-        x = GraphSet() 
+    def _cover(self, c):
+        """
+        Cover column `c` and update the memo key in O(1)
+        """
         self.matrix.cover(c)
-        for r in c.sweep('D'):
-            self.bitarray[r.row*self.A.shape[1] + c.N] = 1
-
-        for r in c.sweep('D'):
-            for j in r.sweep('R'):
-                self.matrix.cover(j.column)
-                self.bitarray[r.row * self.A.shape[1] + j.column.N] = 1
-            int_key = int.from_bytes(self.bitarray.tobytes(), 'little')
-            y = self._search(int_key)
-            if not y is False:
-                x = x.union(self._unique(r, y))
-
-            for j in r.sweep('L'):
-                self.matrix.uncover(j.column)
-                self.bitarray[r.row * self.A.shape[1] + j.column.N] = 0
+        col = self.matrix.N(c)
+        self._key ^= self.zobrist[col]
+        self._signature ^= 1 << col
+        if self._metrics is not None:
+            self._metrics.covers += 1
 
+    def _uncover(self, c):
+        """
+        Uncover column `c` and update the memo key in O(1)
+        """
         self.matrix.uncover(c)
+        col = self.matrix.N(c)
+        self._key ^= self.zobrist[col]
+        self._signature ^= 1 << col
+        if self._metrics is not None:
+            self._metrics.uncovers += 1
+
+    def _choose_item(self):
+        """
+        Return the active primary column with the fewest ways to branch (as
+        in Knuth's Algorithm M), the number of rows that it still needs, and
+        that number of ways
+        """
+        m = self.matrix
+        best = None
+        for c in m.sweep(m.h, 'R'):
+            lo, hi = self._bounds[c]
+            need = max(lo - self._counts[c], 0)
+            theta = m.S(c) + 1 - need
+            if best is None or theta < best[2]:
+                best = (c, need, theta)
+                if theta <= 0:
+                    break
+
+        return best
+
+    def _pick(self, r):
+        """
+        Choose the row of node `r` when the matrix has multiplicities (see
+        `DLX._pick`) and update the memo key in O(1) per column
+        """
+        m = self.matrix
+        bounds, counts = self._bounds, self._counts
+        m.hide(r)
+        row = m.row(r)
+        if row in self._row_zobrist:
+            self._key ^= self._row_zobrist[row]
+            self._signature ^= 1 << (self.A.shape[1] + row)
+        for j in [r, *m.sweep(r, 'R')]:
+            c = m.column(j)
+            if c in bounds:
+                zobrist = self._count_zobrist.get(c)
+                if zobrist is not None:
+                    self._key ^= zobrist[counts[c]] ^ zobrist[counts[c] + 1]
+                counts[c] += 1
+                if counts[c] == bounds[c][1]:
+                    self._cover(c)
+            else:
+                self._cover(c)
+
+    def _unpick(self, r):
+        """
+        Undo `_pick`
+        """
+        m = self.matrix
+        bounds, counts = self._bounds, self._counts
+        for j in [*m.sweep(r, 'L'), r]:
+            c = m.column(j)
+            if c in bounds:
+                if counts[c] == bounds[c][1]:
+                    self._uncover(c)
+                counts[c] -= 1
+                zobrist = self._count_zobrist.get(c)
+                if zobrist is not None:
+                    self._key ^= zobrist[counts[c]] ^ zobrist[counts[c] + 1]
+            else:
+                self._uncover(c)
+        row = m.row(r)
+        if row in self._row_zobrist:
+            self._key ^= self._row_zobrist[row]
+            self._signature ^= 1 << (self.A.shape[1] + row)
+        m.unhide(r)
+
+    def _branches(self):
+        """
+        Return the branches of the search at the current node as (do, undo)
+        pairs of calls that change the matrix the way `_search` does, or
+        None when every primary column is covered (a solution). With
+        multiplicities, every row of the column is a branch (see
+        `_memo_cache_mcc`) and closing it is one more.
+        """
+        m = self.matrix
+        if m.R(m.h) == m.h:
+            return None
+
+        if self._bounds is None:
+            c = self._choose_column()
+            rows = [m.row(r) for r in m.sweep(c, 'D')]
+            return [(partial(self._cover_row, row), partial(self._uncover_row, row))
+                    for row in rows]
+
+        c, need, theta = self._choose_item()
+        if theta <= 0:
+            return []
+        branches = [(partial(self._pick, r), partial(self._unpick, r)) for r in m.sweep(c, 'D')]
+        if need == 0:
+            branches.append((partial(self._cover, c), partial(self._uncover, c)))
+
+        return branches
+
+    def _cover_row(self, row):
+        """
+        Cover every column of `row`, as if it had been chosen by the search
+        """
+        m = self.matrix
+        r = m.row_node(row)
+        if self._bounds is not None:
+            self._pick(r)
+            return
+        self._cover(m.column(r))
+        for j in m.sweep(r, 'R'):
+            self._cover(m.column(j))
+
+    def _uncover_row(self, row):
+        """
+        Undo `_cover_row`
+        """
+        m = self.matrix
+        r = m.row_node(row)
+        if self._bounds is not None:
+            self._unpick(r)
+            return
+        for j in m.sweep(r, 'L'):
+            self._uncover(m.column(j))
+        self._uncover(m.column(r))
+
+    def _cover_rows(self, rows):
+        for row in rows:
+            self._cover_row(row)
+
+    def _uncover_rows(self, rows):
+        for row in reversed(rows):
+            self._uncover_row(row)
+
+    def _worker_args(self):
+        """
+        Arguments for rebuilding this solver in a worker process
+        """
+        memo_entries, memo_bytes, memo_policy = self._memo_args
+        return DXZ, self._A, {'primary_idx': self._primary_idx,
+                              'multiplicities': self._multiplicities,
+                              'engine': self._engine_name,
+                              'memo_entries': memo_entries,
+                              'memo_bytes': memo_bytes,
+                              'memo_policy': memo_policy,
+                              'heuristic': self._heuristic_name,
+                              'seed': self._seed,
+                             }
+
+    def memo_cache(self):
+        """
+        Build the ZDD of the current subproblem bottom-up, as in Algorithm Z,
+        from the ZDD of each subproblem left after choosing a row in the
+        column with the fewest rows
+        """
+        m = self.matrix
+        z = self._manager
+        metrics = self._metrics
+        c = self._choose_column()
+        x = ZDD.EMPTY
+        n = 0  # Solutions in `x`, since the rows of `c` give disjoint sets
+        skip_to = None
+        if self._resume:
+            col, row, x = self._resume.pop(0)
+            if col == m.N(c):
+                skip_to = row
+                n = None
+            else:
+                # The search took a different path, so rely on the memo alone
+                self._resume = []
+                x = ZDD.EMPTY
+
+        self._nodes += 1
+        level = [m.N(c), None, x, 0, m.S(c)]
+        self._frontier.append(level)
+        self._cover(c)
+        for index, r in enumerate(m.sweep(c, 'D')):
+            row = m.row(r)
+            if skip_to is not None:
+                # Rows before the checkpointed one are already in `x`
+                if row != skip_to:
+                    continue
+                skip_to = None
+
+            level[1] = row
+            level[2] = x
+            level[3] = index
+            if self._checkpoint is not None and self._checkpoint_due():
+                self._write_checkpoint()
+
+            if metrics is not None:
+                metrics.visit(len(self._frontier) - 1, 0)
+            for j in m.sweep(r, 'R'):
+                self._cover(m.column(j))
+            y = self._search()
+            if n is not None and self._count is not None:
+                n += self._count
+            else:
+                n = None
+            if self._resume:
+                # Deeper levels were finished and memoized before the restart
+                self._resume = []
+            if y != ZDD.EMPTY:
+                x = z.union(x, z.join(z.singleton(row), y))
+
+            for j in m.sweep(r, 'L'):
+                self._uncover(m.column(j))
+
+        self._uncover(c)
+        self._frontier.pop()
+        self._count = n
 
         return x
 
-    @lru_cache(maxsize=None)
-    def _search(self, int_key):
+    def _memo_cache_mcc(self):
         """
+        Same as `memo_cache` for a matrix with multiplicities. The rows of
+        the chosen column are tried in every order, since the union of the
+        ZDDs absorbs the duplicates and the memo recognizes the repeated
+        subproblems, and a column that needs no more rows is also closed.
         """
-        if self.matrix.h.R == self.matrix.h:
-            # Empty matrix
-            return True
+        m = self.matrix
+        z = self._manager
+        metrics = self._metrics
+        c, need, theta = self._choose_item()
+        if theta <= 0:
+            return ZDD.EMPTY
 
-        x = self.memo_cache()
+        self._nodes += 1
+        level = [m.N(c), None, ZDD.EMPTY, 0, theta]
+        self._frontier.append(level)
+        x = ZDD.EMPTY
+        for index, r in enumerate(m.sweep(c, 'D')):
+            level[3] = index
+            if metrics is not None:
+                metrics.visit(len(self._frontier) - 1, 0)
+            self._pick(r)
+            y = self._search()
+            self._unpick(r)
+            if y != ZDD.EMPTY:
+                x = z.union(x, z.join(z.singleton(m.row(r)), y))
+
+        if need == 0:
+            self._cover(c)
+            x = z.union(x, self._search())
+            self._uncover(c)
+        self._frontier.pop()
 
         return x
 
-    def _unique(self, r, y):
-        if y is True:
-            return GraphSet([[(r.row, -1)]])
-        elif isinstance(y, GraphSet):
-            return GraphSet([[(r.row, -1)]]).join(y)
+    def _search(self):
+        """
+        Solve the subproblem left by the covered columns. A subproblem is
+        fully determined by which columns (primary and secondary) are
+        covered, so results are memoized on a Zobrist hash of that set and
+        verified against the exact bitmask to guard against collisions.
+        """
+        m = self.matrix
+        if m.R(m.h) == m.h:
+            # Empty matrix
+            self._count = 1
+            return ZDD.BASE
+
+        if self._bounds is None:
+            signature = self._signature
         else:
-            # We should never be in here
-            return
+            # The counts of columns that can take more than one row
+            signature = (self._signature, tuple(self._counts[c] for c in self._count_zobrist))
+
+        x = self._memo.get(self._key, signature)
+        if x is not None:
+            self._count = self._memo.weight(self._key)
+            return x
+
+        if self._bounds is None:
+            x = self.memo_cache()
+        else:
+            x = self._memo_cache_mcc()
+            self._count = None
+        # Pass the count along so that the 'count' policy does not walk `x`
+        self._memo.put(self._key, signature, x, self._count)
+
+        return x
+
+    def _parallel_search(self, processes, depth):
+        """
+        Search the branches `depth` levels below the root on a pool of
+        worker processes and return the union of their ZDDs, each joined
+        with the rows that lead to its branch
+        """
+        z = self._manager
+        x = ZDD.EMPTY
+        for prefix, arrays in parallel.run(self, parallel.zdd_branch, processes, depth):
+            y = z.from_arrays(*arrays)
+            for row in prefix:
+                y = z.join(z.singleton(row), y)
+            x = z.union(x, y)
+
+        return x
+
+    def _fingerprint(self):
+        """
+        Hash of the matrix, primary columns, engine and heuristic that a
+        checkpoint belongs to
+        """
+        A = self.matrix.A
+        h = hashlib.sha1()
+        h.update(repr((A.shape, self._primary_idx and list(self._primary_idx),
+                       self._engine_name, self._heuristic_name)).encode())
+        h.update(A.indptr.tobytes())
+        h.update(A.indices.tobytes())
+
+        return h.hexdigest()
+
+    def _checkpoint_due(self):
+        if self._next_checkpoint_nodes is not None and self._nodes >= self._next_checkpoint_nodes:
+            return True
+        if self._next_checkpoint_time is not None and time.time() >= self._next_checkpoint_time:
+            return True
+
+        return False
+
+    def _schedule_checkpoint(self):
+        if self._checkpoint_nodes is not None:
+            self._next_checkpoint_nodes = self._nodes + self._checkpoint_nodes
+        if self._checkpoint_every is not None:
+            self._next_checkpoint_time = time.time() + self._checkpoint_every
+
+    def _write_checkpoint(self):
+        """
+        Atomically write the search frontier, the memoized subproblem results
+        (and the ZDD nodes that they need), and the statistics to the
+        checkpoint file
+        """
+        entries = list(self._memo.items())
+        roots = [x for key, signature, x in entries]
+        roots.extend(level[2] for level in self._frontier)
+        var, lo, hi, roots = self._manager.export(roots)
+        state = {'version': CHECKPOINT_VERSION,
+                 'fingerprint': self._fingerprint(),
+                 'var': array('q', var),
+                 'lo': array('q', lo),
+                 'hi': array('q', hi),
+                 'memo': [(key, signature) for key, signature, x in entries],
+                 'frontier': [(level[0], level[1]) for level in self._frontier],
+                 'roots': roots,
+                 'nodes': self._nodes,
+                 'memo_info': self.memo_info,
+                }
+
+        tmp = f"{self._checkpoint}.tmp"
+        with open(tmp, 'wb') as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._checkpoint)
+        self._schedule_checkpoint()
+
+    def check_checkpoint(self, path):
+        """
+        Read the checkpoint at `path` and return its state, or raise a
+        ValueError if it cannot be read (e.g., it was truncated) or was
+        written for a different matrix, engine or heuristic
+        """
+        try:
+            with open(path, 'rb') as fp:
+                state = pickle.load(fp)
+            version = state['version']
+            fingerprint = state['fingerprint']
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError) as e:
+            raise ValueError(f"Cannot read checkpoint {path}: {e!r}")
+
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {version}")
+        if fingerprint != self._fingerprint():
+            raise ValueError("The checkpoint was written for a different matrix, engine or heuristic")
+
+        return state
+
+    def _read_checkpoint(self, path):
+        """
+        Restore the memo table and its statistics, ZDD nodes, and frontier
+        from a checkpoint so that the next search continues where the
+        checkpoint left off
+        """
+        state = self.check_checkpoint(path)
+        self._writable()
+        roots = self._manager.import_(state['var'], state['lo'], state['hi'], state['roots'])
+        # Before the entries, so that any evictions while restoring add up
+        self._memo.restore_info(state['memo_info'])
+        n_memo = len(state['memo'])
+        for (key, signature), x in zip(state['memo'], roots[:n_memo]):
+            self._memo.put(key, signature, x)
+        self._resume = [(col, row, x) for (col, row), x in zip(state['frontier'], roots[n_memo:])]
+        self._nodes = state['nodes']
+
+    def estimate(self, probes=100, seed=None):
+        """
+        Monte Carlo estimate of the number of search nodes and solutions
+        below the current state (see `estimate.estimate`), probing the same
+        branches as the search (see `_branches`). The estimate ignores
+        memoization, so it is an upper bound on the nodes that DXZ actually
+        searches, and with multiplicities a solution is counted once for
+        every order in which the search can reach it.
+        """
+        return estimate.estimate(self, probes, seed)
+
+    @property
+    def progress(self):
+        """
+        Completed fraction of the current (or last) search
+        """
+        if self._progress is not None and not self.search_incomplete:
+            return self._progress
+
+        return estimate.progress([(level[3], level[4]) for level in self._frontier])
+
+    @property
+    def eta(self):
+        """
+        Estimated number of seconds left in the current search
+        """
+        if self._start_time is None:
+            return None
+        if not self.search_incomplete:
+            return 0.0 if self.progress == 1.0 else None
+
+        return estimate.eta(time.time() - self._start_time, self.progress)
 
-    def search(self, log_time=False, log_resources=False, every=60.0):
+    def search(self, log_time=False, log_resources=False, every=60.0,
+               processes=None, depth=1, checkpoint=None, checkpoint_every=None,
+               checkpoint_nodes=None, resume=None, estimate_probes=None):
         """
-        This is a convenient wrapper function around the `_search` function
+        This is a convenient wrapper function around the `_search` function.
+
+        When `processes` is given, the branches `depth` levels below the root
+        are searched on a pool of that many worker processes.
+
+        When a `checkpoint` path is given, the search state is written to it
+        every `checkpoint_every` seconds (600 by default) and/or after every
+        `checkpoint_nodes` searched subproblems, and once more at the end.
+        Passing that path back as `resume` continues a killed search without
+        redoing the subtrees that had already been finished.
+
+        When `estimate_probes` is given, the size of the search tree is
+        estimated with that many random probes and logged before searching.
+
+        With `log_resources`, a `SAMPLER` thread logs the time, memory, memo
+        statistics, ZDD size, and progress every `every` seconds. Use
+        `sample` instead to collect the `METRICS` counters as JSON lines or
+        callbacks.
         """
+        if processes is not None and (checkpoint is not None or resume is not None):
+            raise ValueError("Checkpoints are not supported with `processes`")
+        if self._multiplicities is not None and (processes is not None or
+                                                 checkpoint is not None or
+                                                 resume is not None):
+            raise ValueError("`processes` and checkpoints are not supported with multiplicities")
 
+        self._nodes = 0
+        self._frontier = []
+        self._resume = []
+        if resume is not None:
+            self._read_checkpoint(resume)
         self.search_incomplete = True
 
+        self._checkpoint = checkpoint
+        if checkpoint is not None:
+            if checkpoint_every is None and checkpoint_nodes is None:
+                checkpoint_every = 600.0
+            self._checkpoint_every = checkpoint_every
+            self._checkpoint_nodes = checkpoint_nodes
+            self._schedule_checkpoint()
+
+        if estimate_probes is not None:
+            logger.warning(self.estimate(estimate_probes))
+
+        if self._metrics is not None:
+            self._metrics.reset()
+
         # Logging time
         start_time = time.time()
+        self._start_time = start_time
+        sampler = None
         if log_resources:
-            self._log_resources(start_time, every)
+            sampler = SAMPLER(self.snapshot, every, callback=self._log_resources).start()
 
         # The real work is done here
-        self.zdd.clear()  # Initializes GraphSet
-
-        self.bitarray.setall(1)
-        int_key = int.from_bytes(self.bitarray.tobytes(), 'little')
-        self.zdd = self._search(int_key)
-        self.search_incomplete = False
+        self._writable()
+        self._key = 0
+        self._signature = 0
+        self._progress = None
+        try:
+            if processes is None:
+                self._zdd = self._search()
+            else:
+                self._zdd = self._parallel_search(processes, depth)
+            self._progress = 1.0
+            if self._metrics is not None:
+                # Memo hits share solutions, so they are only known at the end
+                self._metrics.solutions = self.zdd.count()
+        finally:
+            if self._progress is None:
+                # Interrupted, so keep how far it got
+                self._progress = self.progress
+            self.search_incomplete = False
+            if sampler is not None:
+                sampler.stop()
+        if checkpoint is not None:
+            self._write_checkpoint()
+        self._checkpoint = None
 
         if log_time:
             msg = (self._get_human_readable_time(time.time() - start_time))
             logger.warning(msg)
-            logger.warning(self._search.cache_info())
-            logger.warning(len(self.zdd))
+            logger.warning(self.memo_info)
+            logger.warning(self.zdd.count())
 
-    def _log_resources(self, start_time, every=60.0):
+    # Editing the matrix between searches. Rows and columns keep their
+    # indices (deleted ones are left empty), so the memoized ZDDs stay
+    # meaningful. A subproblem is the set of covered columns, and a row
+    # only takes part in the subproblems where none of its columns are
+    # covered, so adding or deleting a row only invalidates those entries
+    # and the next `search` reuses the rest.
+
+    def _check_editable(self):
+        if self._multiplicities is not None:
+            raise ValueError("Editing is not supported with multiplicities")
         if self.search_incomplete:
-            # Adjust for time drift/creep
-            adjusted_every = every - ((time.time()-start_time) % every)
-            threading.Timer(adjusted_every, self._log_resources, [start_time, every]).start()
+            raise ValueError("The matrix cannot be edited during a search")
 
-            elapsed_time = self._get_human_readable_time(time.time() - start_time)
-            process = psutil.Process(self._pid)
-            memory = process.memory_info()[0] / (1024.0 ** 3)
-            percent = process.memory_percent()
+    def _sync(self):
+        m = self.matrix
+        self._A = m.A
+        self._A_csr = None
+        self._primary_idx = m.primary_idx
 
-            msg = f"{elapsed_time} {memory} GB {percent} % {self._search.cache_info()} {len(self.zdd)}"
-            logger.warning(msg)
+    def _row_mask(self, row):
+        A = self._csr
+
+        return sum(1 << col for col in A.indices[A.indptr[row]:A.indptr[row+1]].tolist())
+
+    def add_row(self, cols, label=None):
+        """
+        Append a row that covers `cols` (with `label` when there are row
+        labels), drop the memo entries that it could change, and return its
+        index. Call `search` again to update the zdd.
+        """
+        self._check_editable()
+        row = self.matrix.add_row(cols)
+        self._sync()
+        if isinstance(self._row_labels, dict):
+            self._row_labels[row] = label
+        elif self._row_labels is not None:
+            self._row_labels = [*self._row_labels, label]
+        self._label_rows = None
+        mask = self._row_mask(row)
+        if mask:
+            self._memo.invalidate(lambda signature: not signature & mask)
+
+        return row
+
+    def delete_row(self, row):
+        """
+        Delete `row` (e.g., a banned placement) and drop the memo entries
+        that it could change. The solutions that used it are also removed
+        from the zdd, so no new search is needed.
+        """
+        self._check_editable()
+        mask = self._row_mask(row)
+        if not mask:
+            return
+        self._writable()
+        self.matrix.delete_row(row)
+        self._sync()
+        self._memo.invalidate(lambda signature: not signature & mask)
+        self._zdd = self._manager.offset(self._zdd, row)
+
+    def add_column(self, primary=True):
+        """
+        Append an empty column and return its index. A secondary column
+        changes nothing until rows use it, while a new primary column
+        changes every subproblem and clears the memo. Call `search` again to
+        update the zdd.
+        """
+        self._check_editable()
+        zobrist = self.zobrist
+        col = self.matrix.add_column(primary)
+        zobrist.append(random.Random(~col).getrandbits(64))
+        self._sync()
+        if primary:
+            self._memo.clear()
+
+        return col
+
+    def delete_column(self, col):
+        """
+        Delete column `col` from the matrix and its rows. Every subproblem
+        either had it covered, and can no longer occur, or had it uncovered
+        and changes, so this clears the memo. Call `search` again to update
+        the zdd.
+        """
+        self._check_editable()
+        self.matrix.delete_column(col)
+        self._sync()
+        self._memo.clear()
+
+    def search_givens(self, rows):
+        """
+        Return the `FAMILY` of solutions that contain the given `rows`. See
+        `batch`.
+        """
+        return self.batch([rows], count=False)[0]
+
+    def batch(self, batch, count=True):
+        """
+        For every list of given rows in `batch` (e.g., the placements fixed
+        by a challenge card), return the number of solutions that contain
+        them or, with `count=False`, their `FAMILY` (givens included). The
+        givens are covered on this solver's matrix, which is only built
+        once, and the memo is shared by the whole batch so that subproblems
+        that recur across cards are only solved once. Conflicting givens
+        have no solutions. The zdd from `search` is left unchanged.
+        """
+        self._writable()
+        z = self._manager
+        results = [None] * len(batch)
+        for i, rows in givens.walk(self, batch):
+            x = ZDD.EMPTY if rows is None else self._search()
+            if count:
+                results[i] = z.count(x)
+                continue
+            for row in rows or ():
+                x = z.join(z.singleton(row), x)
+            results[i] = FAMILY(z, x)
+
+        return results
+
+    def _log_resources(self, snapshot):
+        elapsed_time = self._get_human_readable_time(snapshot['elapsed'])
+        eta = snapshot['eta']
+        if eta is not None:
+            eta = self._get_human_readable_time(eta)
+
+        msg = (f"{elapsed_time} {snapshot['memory']} GB {snapshot['memory_percent']} % "
+               f"{snapshot['memo']} {snapshot['zdd_nodes']} {snapshot['progress']:.2%} ETA {eta}")
+        logger.warning(msg)
 
     def _get_human_readable_time(self, total_time):
         hours, rem = divmod(total_time, 3600)
@@ -207,33 +979,78 @@ class DXZ(object):
 
         return f"{hours:0>2}:{minutes:0>2}:{seconds:05.2f}"
 
+    def stream(self, sink, expand=False):
+        """
+        Write every solution in the zdd (or, with `expand`, every solution
+        from `all_solutions`) to `sink` (see `sink.SINK`) and return the
+        number written
+        """
+        n = 0
+        for sol in (self.all_solutions() if expand else self.solutions):
+            sink.write(sol)
+            n += 1
+
+        return n
+
     def print_solutions(self):
         for sol in self.solutions:
             print(sol)
         print()
 
-    def dump(self, fzdd='zdd.dxz', funiverse='universe.dxz'):
-        with open(fzdd, 'wb') as fp:
-            self.zdd.dump(fp)
+    def dump(self, fzdd='zdd.dxz', binary=False):
+        """
+        Write the solution ZDD as text or, with `binary=True`, in the
+        versioned binary format of `ZDD.write` along with the shape of `A`
+        and the row labels
+        """
+        if not binary:
+            with open(fzdd, 'w') as fp:
+                self._manager.dump(fp, self._zdd)
+            return
 
-        with open(funiverse, 'wb') as fp:
-            pickle.dump(GraphSet.universe(), fp)
-        
+        row_labels = self._row_labels
+        if row_labels is not None:
+            if isinstance(row_labels, dict):
+                # Only the values are kept, in row order
+                row_labels = [row_labels.get(row) for row in range(self.A.shape[0])]
+            row_labels = [label.item() if hasattr(label, 'item') else label
+                          for label in row_labels]
+        meta = {'shape': list(self.A.shape), 'row_labels': row_labels}
+        with open(fzdd, 'wb') as fp:
+            self._manager.write(fp, self._zdd, meta)
 
-    def save(self, fzdd='zdd.dxz', funiverse='universe.dxz'):
+    def save(self, fzdd='zdd.dxz', binary=False):
         """
         Convenience function that calls `dump` function internally
         """
-        self.dump(fzdd, funiverse)
+        self.dump(fzdd, binary)
 
-    def load(self, fzdd='zdd.dxz', funiverse='universe.dxz'):
+    def load(self, fzdd='zdd.dxz'):
         """
+        Load solutions written by `dump`. A text file is parsed into this
+        instance's node manager, while a binary file is memory mapped and
+        replaces the node manager. Its nodes are only copied into a writable
+        node manager once something needs new nodes (e.g., `query` or a new
+        `search`).
         """
-        with open(funiverse, 'rb') as fp:
-            GraphSet.set_universe(pickle.load(fp), traversal='as-is')
-
         with open(fzdd, 'rb') as fp:
-            self.zdd = GraphSet.load(fp)
+            binary = fp.read(len(FORMAT_MAGIC)) == FORMAT_MAGIC
+
+        if not binary:
+            with open(fzdd, 'r') as fp:
+                self._zdd = self._manager.load(fp)
+            return
+
+        manager = MAPPED_ZDD(fzdd)
+        if tuple(manager.meta['shape']) != self.A.shape:
+            manager.close()
+            raise ValueError(f"{fzdd} was written for a matrix of shape "
+                             f"{tuple(manager.meta['shape'])}, not {self.A.shape}")
+        if self._row_labels is None:
+            self._row_labels = manager.meta['row_labels']
+            self._label_rows = None
+        self._manager = manager
+        self._zdd = manager.root
 
 if __name__ == "__main__":
     arr = np.array([[0, 0, 0, 1, 0],
@@ -321,6 +1138,19 @@ if __name__ == "__main__":
     dxz.search()
     dxz.print_solutions()
 
+    # Binary dumps keep the row labels, whether they are a list or a dict
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        for labels in (list('ABCDEF'), row_labels):
+            path = os.path.join(tmp, 'zdd.bin')
+            dxz = DXZ(csc, labels)
+            dxz.search()
+            dxz.dump(path, binary=True)
+            loaded = DXZ(csc)
+            loaded.load(path)
+            assert list(loaded.solutions) == list(dxz.solutions) == [['B', 'D', 'F']]
+            loaded.manager.close()
+
     # Generalized Exact Cover Example
     # 2x2 grid with one L-shaped and two Singleton-shaped pieces.
     #                0  1  2  3  A  B  C
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import random
+
+Estimate = namedtuple('Estimate', ['nodes', 'solutions', 'probes'])
+
+def estimate(solver, probes=100, seed=None):
+    """
+    Knuth's Monte Carlo estimate of the size of the search tree of `solver`
+    (a `DLX` or `DXZ` instance) below its current state.
+
+    Each probe walks from the current node down to a leaf, taking one of
+    the `d` branches from the solver's `_branches` uniformly at random, so
+    that it follows the same tree as the solver's own search (including
+    Algorithm M with multiplicities). The running product of the `d`'s is an
+    unbiased estimate of the number of nodes at each depth, so the sum of
+    the products along a probe estimates the number of nodes in the tree,
+    and the product at a leaf that is a solution estimates the number of
+    solutions. The matrix is left exactly as it was found.
+    """
+    rng = random.Random(seed)
+    total_nodes = 0
+    total_solutions = 0
+    for _ in range(probes):
+        weight = 1
+        nodes = 1
+        undo = []
+        while True:
+            branches = solver._branches()
+            if branches is None:
+                total_solutions += weight
+                break
+            d = len(branches)
+            if d == 0:
+                # Dead end
+                break
+            weight *= d
+            nodes += weight
+            do, undone = branches[rng.randrange(d)]
+            do()
+            undo.append(undone)
+
+        for undone in reversed(undo):
+            undone()
+        total_nodes += nodes
+
+    return Estimate(total_nodes / probes, total_solutions / probes, probes)
+
+def progress(levels):
+    """
+    Fraction of the search tree that has been completed, given the
+    (index, degree) of the row being tried at each level of the current path.
+
+    The top level contributes index / degree of the tree, and each deeper
+    level refines that within the current branch (a mixed-radix fraction),
+    which treats sibling subtrees as equally large.
+    """
+    fraction = 0.0
+    scale = 1.0
+    for index, degree in levels:
+        scale /= degree
+        fraction += index * scale
+
+    return fraction
+
+def eta(elapsed, fraction):
+    """
+    Estimated number of seconds left after `elapsed` seconds, given the
+    completed `fraction` of the search
+    """
+    if fraction <= 0.0:
+        return None
+
+    return elapsed * (1.0 - fraction) / fraction
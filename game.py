@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 
+import hashlib
+import json
+import os
+import shutil
+import tempfile
 import numpy as np
 import piece
-from scipy.ndimage.interpolation import shift
-from scipy.sparse import coo_matrix
+from itertools import permutations, product
+from scipy.sparse import coo_matrix, csc_matrix
+
+# Bump whenever the layout of `pieces_csc` or of the cache files changes
+CACHE_VERSION = 1
 
 class GAME(object):
     def __init__(self, n=5, m=5):
@@ -32,6 +40,12 @@ class GAME(object):
         }
 
         self._pieces_pos = None
+        self._pieces_csc = None
+        self._piece_rows = None  # Rows of `pieces_pos` for each piece
+        self._row_to_piece = None  # (piece key, position index) for each row
+        self._row_placement = None  # (orientation, offset) for each row
+        self._items = None  # Names of the one hot encoded columns
+        self._multiplicities = None
 
         self._piece_to_one_hot = None
         self._one_hot_to_piece = None
@@ -98,8 +112,69 @@ class GAME(object):
 
     @property
     def pieces_pos(self):
+        """
+        Dense copy of `pieces_csc`, which is only built when it is first
+        accessed
+        """
+        if self._pieces_pos is None and self._pieces_csc is not None:
+            self._pieces_pos = self._pieces_csc.toarray()
+
         return self._pieces_pos
 
+    @property
+    def pieces_csc(self):
+        return self._pieces_csc
+
+    @property
+    def row_to_piece(self):
+        """
+        (piece key, position index) of each row of `pieces_csc`, where index
+        0 is the piece when it is not on the board
+        """
+        return self._row_to_piece
+
+    @property
+    def row_placement(self):
+        """
+        (orientation, offset) of each row of `pieces_csc` as an (n_rows, 2)
+        array, where orientation indexes the piece's `ref_idx`, offset is
+        `row * m + col` of the translation, and both are -1 for a piece that
+        is not on the board
+        """
+        return self._row_placement
+
+    @property
+    def primary_idx(self):
+        """
+        Indices of the one hot encoded piece columns in `pieces_pos`, which
+        must each be covered exactly once
+        """
+        start = self.n * self.m + 1
+        n_items = len(self.pieces) if self._items is None else len(self._items)
+
+        return list(range(start, start + n_items))
+
+    @property
+    def multiplicities(self):
+        """
+        `{col: (lo, hi)}` for the shared column of each group of
+        interchangeable pieces after `enumerate_positions(multiplicities=True)`
+        and otherwise None
+        """
+        return self._multiplicities
+
+    @property
+    def identical_pieces(self):
+        """
+        Groups of piece keys that are interchangeable (e.g., the three white
+        pieces)
+        """
+        groups = {}
+        for k, p in self.pieces.items():
+            groups.setdefault(type(p), []).append(k)
+
+        return [group for group in groups.values() if len(group) > 1]
+
     @pieces_pos.setter
     def pieces_pos(self, value):
         self._pieces_pos = value
@@ -238,74 +313,410 @@ class GAME(object):
 
         return self._one_hot_to_piece[idx]
 
-    def enumerate_positions(self):
+    def _item_keys(self, multiplicities=False):
         """
-        For each piece orientation (designated by ref_idx):
-        1. Clear the tmp_board (fill with zeros)
-        2. Place the reference piece on the upper left of the tmp board
-        3. Shift the piece down & across to the correct row & col, 
-           respectively
-        4. Store the piece position in a flattened dense matrix if the 
-           positioned piece does not land inside of the exclusion zone and
-           also append the one hot encoded piece name to this flattened. There 
-           are situations where a part of piece may be off of the board but 
-           not inside of the exclusion zone. In these cases, we also check 
-           that the entire piece is still on the board.
-
-        Since the number of enumerated states is small, we use a dense matrix.
-        The final dimensions of the dense matrix is:
+        Map the name of each one hot encoded column to the key of the piece
+        that it places. With `multiplicities`, each group of interchangeable
+        pieces shares one column that is named after the piece type (e.g.,
+        'white').
+        """
+        if not multiplicities:
+            return {k: k for k in self.pieces}
 
-            n * m + 1 exit space + n_pieces
+        first = {group[0]: group for group in self.identical_pieces}
+        shared = {k for group in first.values() for k in group}
+        items = {}
+        for k, p in self.pieces.items():
+            if k in first:
+                items[type(p).__name__.lower()] = k
+            elif k not in shared:
+                items[k] = k
 
-        and, therefore, includes the exclusion zone and one hot encoded piece 
-        name. A dense matrix makes it easier to manipulate individual matrix 
-        elements, rows, and columns. 
+        return items
 
-        Stores dense position matrix in `pieces_pos` attribute
+    def _placements(self, ref_idx):
         """
+        Column indices, in `pieces_pos`, of the cells that are covered by
+        every translation of the piece orientation `ref_idx` that keeps the
+        piece on the board or in the exit space, with one row per translation
+        in row-major order of the offset.
+
+        All n x m offsets are computed at once by broadcasting the cells of
+        the orientation over the grid of offsets and the translations that
+        leave the board (i.e., land in the exclusion zone or outside of the
+        (n+1) x (m+1) grid) are masked out.
+        """
+        n = self.n
+        m = self.m
+        offsets = np.indices((n, m)).reshape(2, -1).T  # (n*m, 2)
+        cells = offsets[:, np.newaxis, :] + ref_idx[np.newaxis, :, :]  # (n*m, k, 2)
+        rows = cells[..., 0]
+        cols = cells[..., 1]
+        on_board = (rows < n) & (cols < m)
+        on_exit = (rows == 0) & (cols == m)
+        valid = np.all(on_board | on_exit, axis=1)
 
-        getattr(self, 'tmp_board')
+        return np.where(on_board, rows * m + cols, n * m)[valid], np.flatnonzero(valid)
 
-        pieces_pos_list = []
+    def enumerate_positions(self, canonical=False, multiplicities=False, cache_dir=None):
+        """
+        Enumerate every position of every piece. Each row of the resulting
+        0/1 matrix is one piece in one orientation (designated by ref_idx)
+        and translation, or the piece when it is NOT on the board, and the
+        columns are:
+
+            n * m cells + 1 exit space + n_pieces (one hot encoded)
+
+        A piece may be partly off of the board as long as its off board part
+        is exactly the exit space, which is at the top right, while the rest
+        of the exclusion zone (see `exclusion_idx`) is never covered. Rows
+        are ordered by piece, then orientation, then the row and column of
+        the translation, and all of the translations of an orientation are
+        generated at once (see `_placements`).
+
+        The matrix is stored as a `csc_matrix` in `pieces_csc` (and, densely,
+        in `pieces_pos`), and `row_to_piece` gives the (piece key, position
+        index) of each row, where index 0 is the piece not on the board.
+        Returns `pieces_csc, row_to_piece`.
+
+        With a `cache_dir`, the arrays are read from (memory mapped) `.npy`
+        files in a subdirectory named by `cache_key`, and are only enumerated
+        and written there when they are missing or fail their checksums.
+
+        With `canonical=True`, secondary columns are appended that only allow
+        interchangeable pieces (see `identical_pieces`) in increasing order
+        of position, with any pieces that are not on the board last. Each
+        orbit of solutions that only differ by a relabelling of those pieces
+        is then found exactly once and `expand` recovers the rest. The board
+        itself has no symmetry to break since a rotation or reflection that
+        maps the grid onto itself and keeps the exit space in place must fix
+        both the corner next to the exit and the direction toward it, which
+        leaves only the identity.
+
+        With `multiplicities=True`, each group of interchangeable pieces
+        instead shares one primary column (see `multiplicities`) that must be
+        covered at most once per piece in the group, and the group has no row
+        for being off of the board. `pieces_pos` then has a third as many
+        rows for the white pieces and no permutation duplicates at all.
+        """
+        if canonical and multiplicities:
+            raise ValueError("`canonical` and `multiplicities` are alternatives")
+
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, self.cache_key(canonical, multiplicities))
+            if not self._load_positions(path):
+                self._build_positions(canonical, multiplicities)
+                self._save_positions(path)
+        else:
+            self._build_positions(canonical, multiplicities)
 
-        n_pos = 0
+        return self._pieces_csc, self._row_to_piece
+
+    def _build_positions(self, canonical, multiplicities):
         n = self.n
         m = self.m
+        start = n * m + 1
+        self._piece_rows = {}
+        items = self._item_keys(multiplicities)
+        self._items = list(items)
+        groups = {type(self.pieces[group[0]]).__name__.lower(): group
+                  for group in self.identical_pieces}
+
+        row_idx = []
+        col_idx = []
+        placements = []
+        n_pos = 0
+        for i, (item, k) in enumerate(items.items()):
+            if multiplicities and item in groups:
+                # A shared column has no row for being off of the board
+                self._piece_rows[item] = [None]
+            else:
+                # Add edge case when the piece is NOT on the board
+                self._piece_rows[item] = [n_pos]
+                row_idx.append(np.array([n_pos]))
+                col_idx.append(np.array([start + i]))
+                placements.append(np.array([[-1, -1]]))
+                n_pos += 1
+
+            for orientation, ref_idx in enumerate(self.pieces[k].ref_idx):
+                cells, offsets = self._placements(ref_idx)
+                n_placed, size = cells.shape
+                placements.append(np.column_stack([np.full(n_placed, orientation), offsets]))
+                rows = np.arange(n_pos, n_pos + n_placed)
+                self._piece_rows[item].extend(rows.tolist())
+                # The cells of each placement followed by its piece column
+                row_idx.append(np.repeat(rows, size + 1))
+                col_idx.append(np.hstack([cells, np.full((n_placed, 1), start + i)]).ravel())
+                n_pos += n_placed
+
+        self._row_to_piece = [None] * n_pos
+        for k, rows in self._piece_rows.items():
+            for i, row in enumerate(rows):
+                if row is not None:
+                    self._row_to_piece[row] = (k, i)
+
+        self._multiplicities = None
+        if multiplicities:
+            self._multiplicities = {start + self._items.index(item): (0, len(group))
+                                    for item, group in groups.items()}
+
+        row_idx = np.concatenate(row_idx)
+        col_idx = np.concatenate(col_idx)
+        n_cols = start + len(items)
+        if canonical:
+            order_rows, order_cols, n_order = self._order_columns()
+            row_idx = np.concatenate([row_idx, order_rows])
+            col_idx = np.concatenate([col_idx, n_cols + order_cols])
+            n_cols += n_order
+
+        data = np.ones(len(row_idx), dtype='u1')
+        self._pieces_csc = coo_matrix((data, (row_idx, col_idx)),
+                                      shape=(n_pos, n_cols)).tocsc()
+        self._pieces_pos = None
+        self._row_placement = np.concatenate(placements).astype(np.int32)
+
+    def _piece_names(self, row):
+        """
+        Names that select the piece of `row`: its key (or shared column) and
+        its piece type (e.g., 'white')
+        """
+        k, i = self._row_to_piece[row]
+        p = self.pieces[k] if k in self.pieces else self.pieces[self._item_keys(True)[k]]
+
+        return {k, type(p).__name__.lower()}
+
+    def position_rows(self, piece_key, orientation, row, col):
+        """
+        Rows of `pieces_csc` that place `piece_key` in `orientation` (an
+        index into its `ref_idx`) with its reference cell shifted by
+        (row, col). `piece_key` may be a piece type (e.g., 'white'), which
+        selects every interchangeable piece of that type. Pass the rows to
+        `DXZ.query` as `required` or `forbidden`, or as one `any_of` group
+        when there is more than one.
+        """
+        placement = self._row_placement
+        offset = row * self.m + col
+        candidates = np.flatnonzero((placement[:, 0] == orientation) &
+                                    (placement[:, 1] == offset))
+
+        return [int(r) for r in candidates if piece_key in self._piece_names(r)]
+
+    def rows_covering(self, row, col, piece_key=None):
+        """
+        Rows of `pieces_csc` that cover the board cell (row, col), or the
+        exit space when (row, col) is (0, m), optionally only for `piece_key`
+        (a piece key or type as in `position_rows`). A challenge that needs
+        the cell covered by that piece is `DXZ.query(any_of=[rows])`.
+        """
+        j = self.n * self.m if (row, col) == (0, self.m) else row * self.m + col
+        A = self._pieces_csc
+        rows = A.indices[A.indptr[j]:A.indptr[j + 1]].tolist()
+        if piece_key is None:
+            return rows
+
+        return [r for r in rows if piece_key in self._piece_names(r)]
+
+    def cache_key(self, canonical=False, multiplicities=False):
+        """
+        Hex digest that identifies the output of `enumerate_positions` by the
+        board size, the pieces and their orientations, the exclusion zone,
+        the mode, and `CACHE_VERSION`
+        """
+        key = {'version': CACHE_VERSION,
+               'n': self.n,
+               'm': self.m,
+               'pieces': [[k, type(p).__name__, [ref_idx.tolist() for ref_idx in p.ref_idx]]
+                          for k, p in self.pieces.items()],
+               'exclusion': [list(idx) for idx in self.exclusion_idx],
+               'canonical': bool(canonical),
+               'multiplicities': bool(multiplicities),
+              }
+
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    _CACHE_ARRAYS = ('data', 'indices', 'indptr', 'row_item', 'row_position', 'row_placement')
+
+    def _save_positions(self, path):
+        """
+        Write the arrays of `pieces_csc` and its row metadata to `path` as
+        `.npy` files plus a `meta.json` with their SHA-256 checksums. The
+        files are written to a temporary directory that is then renamed, so
+        that concurrent launches never see a partial cache.
+        """
+        A = self._pieces_csc
+        row_item = np.empty(A.shape[0], dtype=np.int32)
+        row_position = np.empty(A.shape[0], dtype=np.int32)
+        for row, (item, i) in enumerate(self._row_to_piece):
+            row_item[row] = self._items.index(item)
+            row_position[row] = i
+        arrays = {'data': A.data,
+                  'indices': A.indices,
+                  'indptr': A.indptr,
+                  'row_item': row_item,
+                  'row_position': row_position,
+                  'row_placement': self._row_placement,
+                 }
+        multiplicities = self._multiplicities or {}
+        meta = {'version': CACHE_VERSION,
+                'shape': list(A.shape),
+                'items': self._items,
+                'multiplicities': [[c, lo, hi] for c, (lo, hi) in multiplicities.items()]
+                                  if self._multiplicities is not None else None,
+                'sha256': {},
+               }
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent)
+        try:
+            for name, arr in arrays.items():
+                arr = np.ascontiguousarray(arr)
+                np.save(os.path.join(tmp, name + '.npy'), arr)
+                meta['sha256'][name] = hashlib.sha256(arr).hexdigest()
+            with open(os.path.join(tmp, 'meta.json'), 'w') as fp:
+                json.dump(meta, fp)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+        except OSError:
+            # Another process won the race (or the cache is read-only)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _load_positions(self, path):
+        """
+        Memory map the arrays written by `_save_positions` and return True,
+        or return False if they are missing, from another `CACHE_VERSION`, or
+        do not match their checksums
+        """
+        try:
+            with open(os.path.join(path, 'meta.json')) as fp:
+                meta = json.load(fp)
+            if meta['version'] != CACHE_VERSION:
+                return False
+            arrays = {}
+            for name in self._CACHE_ARRAYS:
+                arr = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                if hashlib.sha256(arr).hexdigest() != meta['sha256'][name]:
+                    return False
+                arrays[name] = arr
+        except (OSError, ValueError, KeyError):
+            return False
+
+        self._pieces_csc = csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                      shape=tuple(meta['shape']), copy=False)
+        self._pieces_pos = None
+        self._items = meta['items']
+        self._multiplicities = None
+        if meta['multiplicities'] is not None:
+            self._multiplicities = {c: (lo, hi) for c, lo, hi in meta['multiplicities']}
+        self._row_placement = arrays['row_placement']
+        self._row_to_piece = [(self._items[item], int(i)) for item, i in
+                              zip(arrays['row_item'].tolist(), arrays['row_position'].tolist())]
+        self._piece_rows = {item: [None] for item in self._items}
+        for row, (item, i) in enumerate(self._row_to_piece):
+            rows = self._piece_rows[item]
+            rows.extend([None] * (i + 1 - len(rows)))
+            rows[i] = row
+
+        return True
+
+    def _order_columns(self):
+        """
+        Secondary columns that force each pair of consecutive interchangeable
+        pieces, `a` and `b`, into increasing order of position, returned as
+        the (row, column) indices of their nonzeros and the number of columns.
+
+        Position index `i` (1 to P, since index 0 is off of the board) owns
+        threshold column `i - 1`. For the first, third, ... pair, `a` at `i`
+        covers thresholds 0 to `i - 1` and `b` at `j` only covers `j - 1`, so
+        they clash unless `j > i`, and `a` off of the board covers every
+        threshold to keep `b` off of the board too. For the second, fourth,
+        ... pair this is mirrored (`b` covers a suffix and `a` one threshold)
+        so that no piece pays for a long run of thresholds twice.
+        """
+        row_idx = []
+        col_idx = []
+        n_cols = 0
+        for group in self.identical_pieces:
+            for p, (a, b) in enumerate(zip(group, group[1:])):
+                rows_a = np.array(self._piece_rows[a])
+                rows_b = np.array(self._piece_rows[b])
+                P = len(rows_a) - 1
+                if p % 2 == 0:
+                    # `a` off of the board covers every threshold, `a` at `i`
+                    # covers the prefix j < i, and `b` at `i` covers i - 1
+                    prefix_i, prefix_j = np.tril_indices(P + 1, -1)
+                    rows = [np.repeat(rows_a[0], P), rows_a[prefix_i], rows_b[1:]]
+                    cols = [np.arange(P), prefix_j, np.arange(P)]
+                else:
+                    # `a` off of the board covers the last threshold, `a` at
+                    # `i` covers i - 1, and `b` at `i` covers the suffix j >= i - 1
+                    suffix_i, suffix_j = np.triu_indices(P)
+                    rows = [rows_a[[0]], rows_a[1:], rows_b[1 + suffix_i]]
+                    cols = [np.array([P - 1]), np.arange(P), suffix_j]
+                row_idx.extend(rows)
+                col_idx.extend(n_cols + c for c in cols)
+                n_cols += P
+
+        if not row_idx:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0
+
+        return np.concatenate(row_idx), np.concatenate(col_idx), n_cols
+
+    def _relabellings(self, rows):
+        """
+        Split `rows` into the rows of pieces that are not interchangeable and,
+        for each group in `identical_pieces`, the list of distinct ways to
+        reassign the positions of its pieces
+        """
+        if self._multiplicities is not None:
+            raise ValueError("Pieces that share a column have no labels to reassign")
+
+        fixed = []
+        groups = self.identical_pieces
+        positions = [[] for _ in groups]
+        group_of = {k: g for g, group in enumerate(groups) for k in group}
+        for row in rows:
+            k, i = self._row_to_piece[row]
+            if k in group_of:
+                positions[group_of[k]].append(i)
+            else:
+                fixed.append(row)
+
+        choices = []
+        for group, idx in zip(groups, positions):
+            choices.append(sorted(set(permutations(idx))))
+
+        return fixed, groups, choices
+
+    def expand(self, rows):
+        """
+        Returns a generator of every solution, as a sorted tuple of rows in
+        `pieces_pos`, that only differs from the solution `rows` by a
+        relabelling of interchangeable pieces (including `rows` itself)
+        """
+        fixed, groups, choices = self._relabellings(rows)
+        for combo in product(*choices):
+            sol = list(fixed)
+            for group, idx in zip(groups, combo):
+                sol.extend(self._piece_rows[k][i] for k, i in zip(group, idx))
+            yield tuple(sorted(sol))
+
+    def orbit_size(self, rows):
+        """
+        Number of solutions yielded by `expand(rows)`
+        """
+        fixed, groups, choices = self._relabellings(rows)
+        size = 1
+        for choice in choices:
+            size *= len(choice)
 
-        for k in self.pieces.keys():
-            # Add edge case when the piece is NOT on the board
-            self._reset_board('tmp_board')
-            flat_board = self.tmp_board[:n, :m].flatten()
-            board_list = flat_board.tolist()
-            board_list.append(self.tmp_board[0, m])
-            board_list.extend(self.piece_to_one_hot(k))
-            pieces_pos_list.append(board_list)
-            n_pos += 1
-            piece_n_pos = 1
-
-            for ref_idx in self.pieces[k].ref_idx:
-                # Add all other permutations
-                n_ones_on_board = len(ref_idx)
-                for row in range(self.n):
-                    for col in range(self.m):
-                        self._reset_board('tmp_board')
-                        self.tmp_board = (1, tuple(ref_idx.T))
-                        shift(self.tmp_board, (row, col), 
-                              output=self.tmp_board)
-
-                        if not np.any(self.tmp_board[self.exclusion_idx]) and \
-                           self.tmp_board.sum() == n_ones_on_board:
-                            flat_board = self.tmp_board[:n, :m].flatten()
-                            board_list = flat_board.tolist()
-                            board_list.append(self.tmp_board[0, m])
-                            board_list.extend(self.piece_to_one_hot(k))
-                            pieces_pos_list.append(board_list)
-                            n_pos += 1
-                            piece_n_pos += 1
-
-        self.pieces_pos = np.array(pieces_pos_list, dtype='u1')
+        return size
 
 if __name__ == '__main__':
     game = GAME()
     game.enumerate_positions()
     print(game.pieces_pos.shape)
+    game.enumerate_positions(canonical=True)
+    print(game.pieces_pos.shape)
+    game.enumerate_positions(multiplicities=True)
+    print(game.pieces_pos.shape, game.multiplicities)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+def conflicts(solver, rows):
+    """
+    Return True if `rows` cannot all be part of one solution of `solver` (a
+    `DLX` or `DXZ` instance) because they cover a column more often than it
+    allows or include an empty row
+    """
+    A = solver._csr
+    primary = solver._primary_idx
+    if primary is not None:
+        primary = set(primary)
+    multiplicities = solver._multiplicities or {}
+    counts = {}
+    for row in rows:
+        cols = A.indices[A.indptr[row]:A.indptr[row + 1]]
+        if len(cols) == 0:
+            return True
+        for col in cols.tolist():
+            counts[col] = counts.get(col, 0) + 1
+            hi = 1
+            if primary is None or col in primary:
+                hi = multiplicities.get(col, (1, 1))[1]
+            if counts[col] > hi:
+                return True
+
+    return False
+
+def walk(solver, batch):
+    """
+    Returns a generator of (index, rows) for every list of given rows in
+    `batch`, in an order that lets consecutive lists share their covered
+    rows. While a pair is yielded the matrix of `solver` has exactly the
+    rows of `batch[index]` covered (as sorted, distinct `rows`), or `rows`
+    is None if they conflict (see `conflicts`) and nothing extra is covered.
+    The matrix is restored even if the generator is closed early.
+    """
+    cards = sorted((tuple(sorted(set(rows))), i) for i, rows in enumerate(batch))
+    stack = []
+    try:
+        for rows, i in cards:
+            if conflicts(solver, rows):
+                yield i, None
+                continue
+
+            k = 0
+            while k < len(stack) and k < len(rows) and stack[k] == rows[k]:
+                k += 1
+            while len(stack) > k:
+                solver._uncover_row(stack.pop())
+            for row in rows[k:]:
+                solver._cover_row(row)
+                stack.append(row)
+            yield i, rows
+    finally:
+        solver._uncover_rows(stack)
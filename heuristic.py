@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+def _scan(m):
+    """
+    Return the smallest size over the active columns and every active column
+    of that size, in header list order
+    """
+    S = None
+    ties = []
+    for j in m.sweep(m.h, 'R'):
+        s = m.S(j)
+        if S is None or s < S:
+            S = s
+            ties = [j]
+        elif s == S:
+            ties.append(j)
+
+    return ties
+
+def mrv(m, rng=None):
+    """
+    Minimum remaining values: a column with the fewest rows. This is O(1)
+    with an engine that keeps size buckets (`BUCKET_MATRIX`), which breaks
+    ties arbitrarily, and otherwise scans for the leftmost such column.
+    """
+    min_column = getattr(m, 'min_column', None)
+    if min_column is not None:
+        return min_column()
+
+    S = None
+    for j in m.sweep(m.h, 'R'):
+        if S is None or m.S(j) < S:
+            col = j
+            S = m.S(j)
+
+    return col
+
+def mrv_primary(m, rng=None):
+    """
+    MRV with ties broken by the order of the primary columns, so that the
+    column that comes first in `primary_idx` (or in `A` when every column is
+    primary) is chosen
+    """
+    sweep_min = getattr(m, 'sweep_min', None)
+    if sweep_min is not None:
+        return min(sweep_min(), key=m.order)
+
+    return _scan(m)[0]
+
+def mrv_random(m, rng):
+    """
+    MRV with ties broken uniformly at random using `rng`
+    """
+    sweep_min = getattr(m, 'sweep_min', None)
+    if sweep_min is not None:
+        return rng.choice(list(sweep_min()))
+
+    return rng.choice(_scan(m))
+
+HEURISTICS = {
+    'mrv': mrv,
+    'mrv-primary': mrv_primary,
+    'mrv-random': mrv_random,
+}
+
+def get_heuristic(heuristic):
+    """
+    Return the column selection function for the named `heuristic`, or
+    `heuristic` itself when it is already a function of (matrix, rng)
+    """
+    if callable(heuristic):
+        return heuristic
+
+    try:
+        return HEURISTICS[heuristic]
+    except KeyError:
+        raise ValueError(f"Unknown heuristic '{heuristic}', expected one of {list(HEURISTICS)}")
@@ -1,16 +1,95 @@
 #!/usr/bin/env python
 from node import ROOT, DATA, COLUMN
 import numpy as np
-from scipy.sparse import csc_matrix
+from scipy.sparse import csc_matrix, hstack, vstack
+from array import array
+import time
+
+def _csc_layout(A):
+    """
+    Return the row-major (CSR) view of the nonzero pattern of the sorted CSC
+    matrix, `A`, using a single CSR conversion.
+
+    Returns the CSR `indptr` and `indices` along with `csc_to_csr`, which maps
+    the position of each nonzero in `A.indices` to its position in the CSR
+    `indices`.
+    """
+    nnz = A.indices.shape[0]
+    # Carry each nonzero's CSC position through the conversion as its value
+    pos = csc_matrix((np.arange(1, nnz+1), A.indices, A.indptr), shape=A.shape)
+    csr = pos.tocsr()
+    csr.sort_indices()
+    csc_to_csr = np.empty(nnz, dtype=np.int64)
+    csc_to_csr[csr.data - 1] = np.arange(nnz)
+
+    return csr.indptr, csr.indices, csc_to_csr
+
+def _check_multiplicities(multiplicities, primary_idx, n_cols):
+    """
+    Validate a `{col: (lo, hi)}` mapping of primary column multiplicities
+    """
+    if multiplicities is None:
+        return None
+
+    primary = set(range(n_cols)) if primary_idx is None else set(primary_idx)
+    for col, (lo, hi) in multiplicities.items():
+        if col not in primary:
+            raise ValueError(f"Column {col} has a multiplicity but is not primary")
+        if not 0 <= lo <= hi or hi < 1:
+            raise ValueError(f"Invalid multiplicity ({lo}, {hi}) for column {col}")
+
+    return dict(multiplicities)
+
+# The editing methods below keep the engine's copy of `A` in step with its
+# links. Rows and columns are never renumbered, so a deleted row or column is
+# left behind in `A` as an empty one.
+
+def _append_row(A, cols):
+    """
+    Return `A` with a new last row that has a nonzero in each of `cols`
+    """
+    row = csc_matrix((np.ones(len(cols), dtype=A.dtype), (np.zeros(len(cols), dtype=np.int64), cols)),
+                     shape=(1, A.shape[1]))
+
+    return vstack([A, row], format='csc').sorted_indices()
+
+def _append_column(A):
+    """
+    Return `A` with a new, empty last column
+    """
+    return hstack([A, csc_matrix((A.shape[0], 1), dtype=A.dtype)], format='csc')
+
+def _clear_row(A, row):
+    A = A.copy()
+    A.data[A.indices == row] = 0
+    A.eliminate_zeros()
+
+    return A
+
+def _clear_column(A, col):
+    A = A.copy()
+    A.data[A.indptr[col]:A.indptr[col+1]] = 0
+    A.eliminate_zeros()
+
+    return A
+
+def _primary_list(primary_idx, n_cols):
+    return list(range(n_cols)) if primary_idx is None else list(primary_idx)
 
 class MATRIX(object):
-    def __init__(self, A, primary_idx=None):
+    def __init__(self, A, primary_idx=None, bulk=True, multiplicities=None):
         self._h = ROOT()  # Master "root" header for all headers
         self._column_headers = {}
+        self._row_nodes = []  # First node of each row, or None if it is empty
         self._A = A.sorted_indices()
-        self._add_column_headers()
-        self._add_data()
+        self._A.eliminate_zeros()
+        if bulk:
+            self._build()
+        else:
+            self._add_column_headers()
+            self._add_data()
         self._primary_idx = primary_idx
+        self._multiplicities = _check_multiplicities(multiplicities, primary_idx, A.shape[1])
         self._generalize()
 
     @property
@@ -29,6 +108,60 @@ class MATRIX(object):
     def primary_idx(self):
         return self._primary_idx
 
+    @property
+    def multiplicities(self):
+        """
+        `{col: (lo, hi)}` for the primary columns that must be covered between
+        `lo` and `hi` times rather than exactly once, or None
+        """
+        return self._multiplicities
+
+    def _build(self):
+        """
+        Add column headers and data in one pass over the `indptr`/`indices`
+        arrays rather than slicing `A` for every column and every row
+        """
+        A = self.A
+        sizes = np.diff(A.indptr).tolist()
+        for col in range(A.shape[1]):
+            self.h.L.R = COLUMN()
+            self.h.L.R.L = self.h.L
+            self.h.L.R.R = self.h
+            self.h.L = self.h.L.R
+            self.h.L.N = col
+            self.h.L.S = sizes[col]
+            self.column_headers[col] = self.h.L
+
+        csr_indptr, csr_indices, csc_to_csr = _csc_layout(A)
+        csr_indptr = csr_indptr.tolist()
+        csr_indices = csr_indices.tolist()
+
+        # Data nodes are created in row-major order and linked left/right
+        nodes = []
+        for row in range(A.shape[0]):
+            last = False
+            for col in csr_indices[csr_indptr[row]:csr_indptr[row+1]]:
+                x = DATA()
+                x.column = self.column_headers[col]
+                x.row = row
+                if last:
+                    x.L = last
+                    x.R = last.R
+                    x.L.R = x
+                    x.R.L = x
+                last = x
+                nodes.append(x)
+            self._row_nodes.append(last.R if last else None)
+
+        # Then linked up/down by walking the nonzeros in column-major order
+        for col, col_header in self.column_headers.items():
+            for p in csc_to_csr[A.indptr[col]:A.indptr[col+1]].tolist():
+                x = nodes[p]
+                x.U = col_header.U
+                x.D = col_header
+                x.D.U = x
+                x.U.D = x
+
     def _add_column_headers(self):
         """
         Add column headers to root node, `h`
@@ -68,6 +201,7 @@ class MATRIX(object):
                     x.L.R = x
                     x.R.L = x
                 last = x
+            self._row_nodes.append(last.R if last else None)
 
     def _generalize(self):
         if self.primary_idx is not None:
@@ -106,15 +240,737 @@ class MATRIX(object):
         c.R.L = c
         c.L.R = c
 
+    def hide(self, x):
+        """
+        Unlink every node in the row of node `x` from its column, as if the
+        row had been deleted, without covering any column
+        """
+        for j in [x, *x.sweep('R')]:
+            j.D.U = j.U
+            j.U.D = j.D
+            j.column.S = j.column.S - 1
+
+    def unhide(self, x):
+        """
+        Undo `hide`
+        """
+        for j in [*x.sweep('L'), x]:
+            j.column.S = j.column.S + 1
+            j.D.U = j
+            j.U.D = j
+
+    def _check_cols(self, cols):
+        cols = sorted(set(int(col) for col in cols))
+        for col in cols:
+            if col not in self.column_headers:
+                raise ValueError(f"Column {col} does not exist or was deleted")
+
+        return cols
+
+    def add_row(self, cols):
+        """
+        Append a row with a nonzero in each of `cols`, link it at the bottom
+        of those columns, and return its index. Like the other editing
+        methods, this must only be called while no column is covered (i.e.,
+        between searches).
+        """
+        cols = self._check_cols(cols)
+        row = self._A.shape[0]
+        last = False
+        for col in cols:
+            x = DATA()
+            col_header = self.column_headers[col]
+            x.U = col_header.U
+            x.D = col_header
+            x.D.U = x
+            x.U.D = x
+            x.column = col_header
+            x.row = row
+            col_header.S = col_header.S + 1
+            if last:
+                x.L = last
+                x.R = last.R
+                x.L.R = x
+                x.R.L = x
+            last = x
+        self._row_nodes.append(last.R if last else None)
+        self._A = _append_row(self._A, cols)
+
+        return row
+
+    def delete_row(self, row):
+        """
+        Unlink every node of `row` for good. The row keeps its index and
+        becomes empty.
+        """
+        x = self.row_node(row)
+        if x is None:
+            return
+        self.hide(x)
+        self._row_nodes[row] = None
+        self._A = _clear_row(self._A, row)
+
+    def add_column(self, primary=True):
+        """
+        Append an empty column, as the last primary column or as a secondary
+        column, and return its index
+        """
+        col = self._A.shape[1]
+        if not primary:
+            self._primary_idx = _primary_list(self._primary_idx, col)
+        elif self._primary_idx is not None:
+            self._primary_idx = [*self._primary_idx, col]
+
+        c = COLUMN()
+        c.N = col
+        c.S = 0
+        if primary:
+            c.L = self.h.L
+            c.R = self.h
+            self.h.L.R = c
+            self.h.L = c
+        self.column_headers[col] = c
+        self._A = _append_column(self._A)
+
+        return col
+
+    def delete_column(self, col):
+        """
+        Unlink column `col` and remove its nodes from their rows, so that
+        those rows no longer cover it. The column keeps its index and becomes
+        empty.
+        """
+        self._check_cols([col])
+        c = self.column_headers.pop(col)
+        c.R.L = c.L
+        c.L.R = c.R
+        for i in c.sweep('D'):
+            i.L.R = i.R
+            i.R.L = i.L
+            if self._row_nodes[i.row] is i:
+                self._row_nodes[i.row] = i.R if i.R is not i else None
+        self._primary_idx = [j for j in _primary_list(self._primary_idx, self._A.shape[1]) if j != col]
+        if self._multiplicities is not None:
+            self._multiplicities.pop(col, None)
+        self._A = _clear_column(self._A, col)
+
+    # The accessors below give `DLX` and `DXZ` one interface that works for
+    # both the object engine and `ARRAY_MATRIX`
+
+    def sweep(self, x, direction_attr):
+        return x.sweep(direction_attr)
+
+    def L(self, x):
+        return x.L
+
+    def R(self, x):
+        return x.R
+
+    def U(self, x):
+        return x.U
+
+    def D(self, x):
+        return x.D
+
+    def column(self, x):
+        return x.column
+
+    def row(self, x):
+        return x.row
+
+    def S(self, c):
+        return c.S
+
+    def N(self, c):
+        return c.N
+
+    def row_node(self, row):
+        """
+        Return the first node of `row`, or None if the row is empty
+        """
+        return self._row_nodes[row]
+
+class ARRAY_MATRIX(object):
+    """
+    Dancing links stored in flat, preallocated integer arrays (the DLX1
+    layout from Knuth) rather than in `DATA`/`COLUMN` objects.
+
+    Node 0 is the root header, node `col + 1` is the header for column `col`,
+    and every nonzero element of `A` gets one data node after the headers.
+    Nodes are plain integers so the links live in `array` objects that are
+    indexed directly inside of `cover` and `uncover`.
+    """
+
+    def __init__(self, A, primary_idx=None, multiplicities=None):
+        self._A = A.sorted_indices()
+        self._A.eliminate_zeros()
+        self._primary_idx = primary_idx
+        self._multiplicities = _check_multiplicities(multiplicities, primary_idx, A.shape[1])
+        self._column_headers = {col: col + 1 for col in range(self.A.shape[1])}
+        self._n_cols = A.shape[1]  # Columns whose header is node `col + 1`
+        self._names = {}  # Column of each header added by `add_column`
+
+        self._build()
+        self._links = {'L': self._L, 'R': self._R, 'U': self._U, 'D': self._D}
+        self._generalize()
+
+    @property
+    def h(self):
+        return 0
+
+    @property
+    def column_headers(self):
+        return self._column_headers
+
+    @property
+    def A(self):
+        return self._A
+
+    @property
+    def primary_idx(self):
+        return self._primary_idx
+
+    @property
+    def multiplicities(self):
+        """
+        `{col: (lo, hi)}` for the primary columns that must be covered between
+        `lo` and `hi` times rather than exactly once, or None
+        """
+        return self._multiplicities
+
+    def _build(self):
+        """
+        Wire every link in bulk from the `indptr`/`indices` arrays of `A`.
+
+        Data nodes are numbered in row-major order so that left/right links
+        are neighbouring nodes, while up/down links follow the column-major
+        order of `A`.
+        """
+        A = self.A
+        n_rows, n_cols = A.shape
+        nnz = A.indices.shape[0]
+        base = n_cols + 1
+        n_nodes = base + nnz
+        csr_indptr, csr_indices, csc_to_csr = _csc_layout(A)
+
+        L = np.empty(n_nodes, dtype=np.int32)
+        R = np.empty(n_nodes, dtype=np.int32)
+        U = np.empty(n_nodes, dtype=np.int32)
+        D = np.empty(n_nodes, dtype=np.int32)
+        C = np.empty(n_nodes, dtype=np.int32)
+        row = np.full(n_nodes, -1, dtype=np.int32)
+        S = np.zeros(base, dtype=np.int32)
+
+        # Headers form a circular list with the root, `h`
+        headers = np.arange(base)
+        L[:base] = headers - 1
+        L[0] = n_cols
+        R[:base] = headers + 1
+        R[n_cols] = 0
+        C[:base] = headers
+        S[1:] = np.diff(A.indptr)
+
+        # Left/right links within each row
+        nodes = base + np.arange(nnz)
+        row_sizes = np.diff(csr_indptr)
+        row_of = np.repeat(np.arange(n_rows), row_sizes)
+        first = base + csr_indptr[:-1]
+        last = base + csr_indptr[1:] - 1
+        L[base:] = nodes - 1
+        R[base:] = nodes + 1
+        nonempty = row_sizes > 0
+        L[first[nonempty]] = last[nonempty]
+        R[last[nonempty]] = first[nonempty]
+        C[base:] = csr_indices + 1
+        row[base:] = row_of
+        self._row_start = np.where(nonempty, first, -1).tolist()
+
+        # Up/down links within each column, including the header
+        col_nodes = base + csc_to_csr
+        col_sizes = S[1:]
+        col_of = np.repeat(np.arange(1, base), col_sizes)
+        up = np.empty(nnz, dtype=np.int64)
+        down = np.empty(nnz, dtype=np.int64)
+        up[1:] = col_nodes[:-1]
+        down[:-1] = col_nodes[1:]
+        col_first = A.indptr[:-1]
+        col_last = A.indptr[1:] - 1
+        nonempty = col_sizes > 0
+        up[col_first[nonempty]] = col_of[col_first[nonempty]]
+        down[col_last[nonempty]] = col_of[col_last[nonempty]]
+        U[col_nodes] = up
+        D[col_nodes] = down
+        U[:base] = headers
+        D[:base] = headers
+        U[headers[1:][nonempty]] = col_nodes[col_last[nonempty]]
+        D[headers[1:][nonempty]] = col_nodes[col_first[nonempty]]
+
+        self._L = array('i', L.tobytes())
+        self._R = array('i', R.tobytes())
+        self._U = array('i', U.tobytes())
+        self._D = array('i', D.tobytes())
+        self._C = array('i', C.tobytes())
+        self._row = array('i', row.tobytes())
+        self._S = array('i', S.tobytes())
+
+    def _generalize(self):
+        """
+        Unlink secondary columns from the header list so that they are
+        never chosen but are still covered by the rows that use them
+        """
+        if self.primary_idx is not None:
+            prev = self.h
+            for col in self._primary_idx:
+                self._R[prev] = col + 1
+                self._L[col + 1] = prev
+                prev = col + 1
+            self._R[prev] = self.h
+            self._L[self.h] = prev
+
+            secondary_idx = set(range(self.A.shape[1])) - set(self._primary_idx)
+            for col in secondary_idx:
+                self._L[col + 1] = col + 1
+                self._R[col + 1] = col + 1
+
+    def cover(self, c):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, c):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def hide(self, x):
+        """
+        Unlink every node in the row of node `x` from its column, as if the
+        row had been deleted, without covering any column
+        """
+        R, U, D, C, S = self._R, self._U, self._D, self._C, self._S
+        j = x
+        while True:
+            D[U[j]] = D[j]
+            U[D[j]] = U[j]
+            S[C[j]] -= 1
+            j = R[j]
+            if j == x:
+                break
+
+    def unhide(self, x):
+        """
+        Undo `hide`
+        """
+        L, U, D, C, S = self._L, self._U, self._D, self._C, self._S
+        j = x
+        while True:
+            j = L[j]
+            S[C[j]] += 1
+            D[U[j]] = j
+            U[D[j]] = j
+            if j == x:
+                break
+
+    _check_cols = MATRIX._check_cols
+
+    def _new_node(self, c, row):
+        """
+        Append a node, linked to itself, for column header `c` and return it
+        """
+        x = len(self._L)
+        for link in (self._L, self._R, self._U, self._D):
+            link.append(x)
+        self._C.append(c)
+        self._row.append(row)
+
+        return x
+
+    def add_row(self, cols):
+        """
+        Append a row with a nonzero in each of `cols`, link it at the bottom
+        of those columns, and return its index. Like the other editing
+        methods, this must only be called while no column is covered (i.e.,
+        between searches).
+        """
+        cols = self._check_cols(cols)
+        L, R, U, D, S = self._L, self._R, self._U, self._D, self._S
+        row = self._A.shape[0]
+        first = -1
+        for col in cols:
+            c = self.column_headers[col]
+            x = self._new_node(c, row)
+            U[x] = U[c]
+            D[x] = c
+            D[U[c]] = x
+            U[c] = x
+            S[c] += 1
+            if first >= 0:
+                L[x] = L[first]
+                R[x] = first
+                R[L[first]] = x
+                L[first] = x
+            else:
+                first = x
+        self._row_start.append(first)
+        self._A = _append_row(self._A, cols)
+
+        return row
+
+    def delete_row(self, row):
+        """
+        Unlink every node of `row` for good. The row keeps its index and
+        becomes empty.
+        """
+        x = self.row_node(row)
+        if x is None:
+            return
+        self.hide(x)
+        self._row_start[row] = -1
+        self._A = _clear_row(self._A, row)
+
+    def add_column(self, primary=True):
+        """
+        Append an empty column, as the last primary column or as a secondary
+        column, and return its index
+        """
+        col = self._A.shape[1]
+        if not primary:
+            self._primary_idx = _primary_list(self._primary_idx, col)
+        elif self._primary_idx is not None:
+            self._primary_idx = [*self._primary_idx, col]
+
+        c = self._new_node(len(self._L), -1)
+        self._S.extend([0] * (c + 1 - len(self._S)))
+        if primary:
+            L, R = self._L, self._R
+            L[c] = L[self.h]
+            R[c] = self.h
+            R[L[self.h]] = c
+            L[self.h] = c
+        self.column_headers[col] = c
+        self._names[c] = col
+        self._A = _append_column(self._A)
+
+        return col
+
+    def delete_column(self, col):
+        """
+        Unlink column `col` and remove its nodes from their rows, so that
+        those rows no longer cover it. The column keeps its index and becomes
+        empty.
+        """
+        self._check_cols([col])
+        L, R, D = self._L, self._R, self._D
+        c = self.column_headers.pop(col)
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            R[L[i]] = R[i]
+            L[R[i]] = L[i]
+            row = self._row[i]
+            if self._row_start[row] == i:
+                self._row_start[row] = R[i] if R[i] != i else -1
+            i = D[i]
+        self._primary_idx = [j for j in _primary_list(self._primary_idx, self._A.shape[1]) if j != col]
+        if self._multiplicities is not None:
+            self._multiplicities.pop(col, None)
+        self._A = _clear_column(self._A, col)
+
+    def sweep(self, x, direction_attr):
+        link = self._links[direction_attr]
+        y = link[x]
+        while y != x:
+            yield y
+            y = link[y]
+
+    def L(self, x):
+        return self._L[x]
+
+    def R(self, x):
+        return self._R[x]
+
+    def U(self, x):
+        return self._U[x]
+
+    def D(self, x):
+        return self._D[x]
+
+    def column(self, x):
+        return self._C[x]
+
+    def row(self, x):
+        return self._row[x]
+
+    def S(self, c):
+        return self._S[c]
+
+    def N(self, c):
+        return c - 1 if c <= self._n_cols else self._names[c]
+
+    def row_node(self, row):
+        """
+        Return the first node of `row`, or None if the row is empty
+        """
+        x = self._row_start[row]
+
+        return x if x >= 0 else None
+
+class BUCKET_MATRIX(ARRAY_MATRIX):
+    """
+    `ARRAY_MATRIX` that also keeps every active (primary and uncovered)
+    column in a bucket queue indexed by its size, so that a column with the
+    fewest rows is found without scanning the header list.
+
+    Each bucket is a circular doubly linked list whose head is node
+    `base + size` in the `_next`/`_prev` arrays (`base` is the first id after
+    the column headers). `cover` and `uncover` move a column between buckets
+    whenever its size changes and track a lower bound on the smallest
+    nonempty bucket, so `min_column` runs in amortized O(1).
+    """
+
+    def __init__(self, A, primary_idx=None, multiplicities=None):
+        super().__init__(A, primary_idx, multiplicities)
+        self._init_buckets()
+
+    def _init_buckets(self):
+        n_headers = max(self.column_headers.values(), default=0) + 1
+        self._base = n_headers
+        self._max_size = max(self._S[1:], default=0)
+        self._next = array('i', range(n_headers + self._max_size + 1))
+        self._prev = array('i', self._next)
+        self._active = array('b', [0]) * n_headers
+        self._order = array('i', [-1]) * n_headers  # Position in the header list
+        self._lowest = 0
+        for i, c in enumerate(self.sweep(self.h, 'R')):
+            self._order[c] = i
+            self._active[c] = 1
+            self._push(c)
+
+    def _push(self, c):
+        """
+        Insert column `c` at the front of the bucket for its size
+        """
+        nxt, prv = self._next, self._prev
+        head = self._base + self._S[c]
+        n = nxt[head]
+        nxt[c] = n
+        prv[c] = head
+        prv[n] = c
+        nxt[head] = c
+        if self._S[c] < self._lowest:
+            self._lowest = self._S[c]
+
+    def _pop(self, c):
+        """
+        Remove column `c` from its bucket
+        """
+        nxt, prv = self._next, self._prev
+        nxt[prv[c]] = nxt[c]
+        prv[nxt[c]] = prv[c]
+
+    def cover(self, c):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        nxt, prv, active, base = self._next, self._prev, self._active, self._base
+        lowest = self._lowest
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        if active[c]:
+            nxt[prv[c]] = nxt[c]
+            prv[nxt[c]] = prv[c]
+            active[c] = 0
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                col = C[j]
+                s = S[col] - 1
+                S[col] = s
+                if active[col]:
+                    # Move the column down one bucket
+                    nxt[prv[col]] = nxt[col]
+                    prv[nxt[col]] = prv[col]
+                    head = base + s
+                    n = nxt[head]
+                    nxt[col] = n
+                    prv[col] = head
+                    prv[n] = col
+                    nxt[head] = col
+                    if s < lowest:
+                        lowest = s
+                j = R[j]
+            i = D[i]
+        self._lowest = lowest
+
+    def uncover(self, c):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        nxt, prv, active, base = self._next, self._prev, self._active, self._base
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                col = C[j]
+                s = S[col] + 1
+                S[col] = s
+                if active[col]:
+                    # Move the column up one bucket
+                    nxt[prv[col]] = nxt[col]
+                    prv[nxt[col]] = prv[col]
+                    head = base + s
+                    n = nxt[head]
+                    nxt[col] = n
+                    prv[col] = head
+                    prv[n] = col
+                    nxt[head] = col
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+        if self._order[c] >= 0:
+            # Only primary columns are ever chosen
+            active[c] = 1
+            self._push(c)
+
+    def hide(self, x):
+        super().hide(x)
+        self._rebucket(x)
+
+    def unhide(self, x):
+        super().unhide(x)
+        self._rebucket(x)
+
+    # Edits change column sizes (possibly past the last bucket) or add
+    # headers, so the buckets are simply rebuilt from the header list
+
+    def add_row(self, cols):
+        row = super().add_row(cols)
+        self._init_buckets()
+
+        return row
+
+    def delete_row(self, row):
+        super().delete_row(row)
+        self._init_buckets()
+
+    def add_column(self, primary=True):
+        col = super().add_column(primary)
+        self._init_buckets()
+
+        return col
+
+    def delete_column(self, col):
+        super().delete_column(col)
+        self._init_buckets()
+
+    def _rebucket(self, x):
+        """
+        Move the active columns of the row of node `x` to the buckets for
+        their current sizes
+        """
+        j = x
+        while True:
+            c = self._C[j]
+            if self._active[c]:
+                self._pop(c)
+                self._push(c)
+            j = self._R[j]
+            if j == x:
+                break
+
+    def min_size(self):
+        """
+        Return the size of the smallest active column, or None when every
+        primary column is covered
+        """
+        if self._R[self.h] == self.h:
+            return None
+
+        nxt = self._next
+        head = self._base + self._lowest
+        while nxt[head] == head:
+            head += 1
+        self._lowest = head - self._base
+
+        return self._lowest
+
+    def min_column(self):
+        """
+        Return the most recently resized column with the fewest rows, or
+        None when every primary column is covered
+        """
+        s = self.min_size()
+        if s is None:
+            return None
+
+        return self._next[self._base + s]
+
+    def sweep_min(self):
+        """
+        Returns a generator of every active column with the fewest rows
+        """
+        s = self.min_size()
+        if s is None:
+            return
+
+        head = self._base + s
+        c = self._next[head]
+        while c != head:
+            yield c
+            c = self._next[c]
+
+    def order(self, c):
+        """
+        Position of column `c` in the header list (the `primary_idx` order),
+        or -1 for a secondary column
+        """
+        return self._order[c]
+
+ENGINES = {
+    'object': MATRIX,
+    'array': ARRAY_MATRIX,
+    'bucket': BUCKET_MATRIX,
+}
+
+def get_engine(engine):
+    """
+    Return the matrix class that implements the named `engine`
+    """
+    try:
+        return ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {list(ENGINES)}")
+
 
 if __name__ == '__main__':
 
     def choose_column(m):
         S = np.inf
-        for j in m.h.sweep('R'):
-            if j.S < S:
+        for j in m.sweep(m.h, 'R'):
+            if m.S(j) < S:
                 col = j
-                S = j.S
+                S = m.S(j)
         return col
 
     # ZDD Example
@@ -125,10 +981,28 @@ if __name__ == '__main__':
                     [0, 0, 1, 0, 1, 0]], dtype='u1')
 
     csc = csc_matrix(arr)
-    m = MATRIX(csc)
-    for c in m.h.sweep('R'):
-        for r in c.sweep('D'):
-            print(f"{r.row}, {c.N}")
+    for engine in ENGINES.values():
+        m = engine(csc)
+        for c in m.sweep(m.h, 'R'):
+            for r in m.sweep(c, 'D'):
+                print(f"{m.row(r)}, {m.N(c)}")
+
+    # Construction benchmark on random placement matrices with five nonzeros
+    # per row, comparing the original per-row/per-column constructor with
+    # the bulk builds
+    rng = np.random.RandomState(0)
+    for n_rows, n_cols in [(2000, 200), (8000, 400), (32000, 800)]:
+        rows = np.repeat(np.arange(n_rows), 5)
+        cols = rng.randint(0, n_cols, rows.shape[0])
+        csc = csc_matrix((np.ones(rows.shape[0], dtype='u1'), (rows, cols)),
+                         shape=(n_rows, n_cols))
+        for name, build in [('legacy', lambda: MATRIX(csc, bulk=False)),
+                            ('object', lambda: MATRIX(csc)),
+                            ('array', lambda: ARRAY_MATRIX(csc)),
+                           ]:
+            start_time = time.time()
+            build()
+            print(f"{n_rows} x {n_cols} {name}: {time.time() - start_time:.3f} s")
 
     # col = choose_column(m)
     # m.cover(col)
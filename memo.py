@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+from collections import OrderedDict, namedtuple
+import heapq
+import sys
+
+MemoInfo = namedtuple('MemoInfo', ['hits', 'misses', 'collisions', 'evictions',
+                                   'currsize', 'nbytes'])
+
+# Approximate cost of one dict slot, the OrderedDict link, and the entry tuple
+ENTRY_OVERHEAD = 160
+
+class MEMO(object):
+    """
+    Bounded memo table that is owned by a single solver instance.
+
+    Entries are stored under a hash `key` together with the exact `signature`
+    of the subproblem so that hash collisions are detected rather than
+    returned. When `max_entries` or `max_bytes` is exceeded, entries are
+    evicted according to `policy`:
+
+        'lru'   - evict the least recently used entry
+        'count' - evict the entry with the smallest `weight(value)` (e.g.,
+                  the number of solutions it covers), keeping the entries
+                  that are most expensive to recompute
+
+    Only this table is bounded. `nbytes` accounts for the keys, signatures,
+    and table overhead, but not for the values (ZDD nodes), which are shared
+    with the rest of the solution and stay in their node manager (along with
+    its unique table) after their entry is evicted. The weight of an entry
+    is found once, when it is put, and kept until it is evicted.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, policy='lru', weight=None):
+        if policy not in ('lru', 'count'):
+            raise ValueError(f"Unknown policy '{policy}', expected 'lru' or 'count'")
+        if policy == 'count' and weight is None:
+            raise ValueError("The 'count' policy requires a `weight` function")
+
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._weight = weight
+        self._table = OrderedDict()
+        self._heap = []  # (weight, key) pairs for the 'count' policy
+        self._weights = {}
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._evictions = 0
+
+    @property
+    def info(self):
+        return MemoInfo(self._hits,
+                        self._misses,
+                        self._collisions,
+                        self._evictions,
+                        len(self._table),
+                        self._nbytes,
+                       )
+
+    def restore_info(self, info):
+        """
+        Set the hit, miss, collision and eviction counters from a `MemoInfo`
+        (e.g., one saved in a checkpoint). The size and bytes always follow
+        the entries in the table.
+        """
+        self._hits = info.hits
+        self._misses = info.misses
+        self._collisions = info.collisions
+        self._evictions = info.evictions
+
+    @property
+    def policy(self):
+        return self._policy
+
+    def __len__(self):
+        return len(self._table)
+
+    def __contains__(self, key):
+        return key in self._table
+
+    def items(self):
+        """
+        Returns a generator of (key, signature, value) for every entry
+        """
+        for key, (signature, value) in self._table.items():
+            yield key, signature, value
+
+    def _entry_bytes(self, key, signature):
+        return sys.getsizeof(key) + sys.getsizeof(signature) + ENTRY_OVERHEAD
+
+    def get(self, key, signature):
+        """
+        Return the value stored for `key` if its signature matches, otherwise
+        return None
+        """
+        entry = self._table.get(key)
+        if entry is not None:
+            if entry[0] == signature:
+                self._hits += 1
+                if self._policy == 'lru':
+                    self._table.move_to_end(key)
+                return entry[1]
+            self._collisions += 1
+
+        self._misses += 1
+
+        return None
+
+    def weight(self, key):
+        """
+        Return the weight stored for `key` by the 'count' policy, or None
+        """
+        return self._weights.get(key)
+
+    def put(self, key, signature, value, weight=None):
+        """
+        Store `value` for `key` and evict entries until the table is back
+        within its budget. With the 'count' policy, a caller that already
+        knows the `weight` of `value` can pass it instead of having it
+        computed.
+        """
+        self.discard(key)
+        self._table[key] = (signature, value)
+        self._nbytes += self._entry_bytes(key, signature)
+        if self._policy == 'count':
+            if weight is None:
+                weight = self._weight(value)
+            self._weights[key] = weight
+            heapq.heappush(self._heap, (weight, key))
+            if len(self._heap) > 2 * len(self._table) + 64:
+                # Drop heap items left behind by replaced or discarded entries
+                self._heap = [(w, k) for k, w in self._weights.items()]
+                heapq.heapify(self._heap)
+
+        while self._over_budget():
+            self._evict()
+
+    def discard(self, key):
+        """
+        Remove the entry for `key`, if present
+        """
+        entry = self._table.pop(key, None)
+        if entry is not None:
+            self._nbytes -= self._entry_bytes(key, entry[0])
+            self._weights.pop(key, None)
+
+    def invalidate(self, predicate):
+        """
+        Remove every entry whose signature satisfies `predicate` (e.g., the
+        subproblems that a changed row or column could affect) and return
+        the number of entries removed
+        """
+        keys = [key for key, (signature, value) in self._table.items() if predicate(signature)]
+        for key in keys:
+            self.discard(key)
+
+        return len(keys)
+
+    def _over_budget(self):
+        if self._max_entries is not None and len(self._table) > self._max_entries:
+            return True
+        if self._max_bytes is not None and self._nbytes > self._max_bytes:
+            return True
+
+        return False
+
+    def _evict(self):
+        if self._policy == 'lru':
+            key, (signature, value) = self._table.popitem(last=False)
+            self._nbytes -= self._entry_bytes(key, signature)
+        else:
+            while True:
+                weight, key = heapq.heappop(self._heap)
+                # Skip heap items left behind by replaced or discarded entries
+                if self._weights.get(key) == weight:
+                    break
+            self.discard(key)
+
+        self._evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry and release the memory held by the table
+        """
+        self._table = OrderedDict()
+        self._heap = []
+        self._weights = {}
+        self._nbytes = 0
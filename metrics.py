@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+import json
+import os
+import threading
+import time
+import psutil
+
+class METRICS(object):
+    """
+    Counters for the internals of a search.
+
+    A solver only updates these when an instance is attached to its
+    `metrics` property, and otherwise pays a single `is None` test per search
+    node. `nodes[d]` is the number of branch rows that were tried at depth
+    `d` (including the rows of a last column that are counted at once
+    without descending), which every engine counts the same way so that
+    they can be compared. `covers` and `uncovers` count column operations,
+    and `solutions` counts the exact covers found so far.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes = []
+        self.covers = 0
+        self.uncovers = 0
+        self.solutions = 0
+
+    def visit(self, depth, covers, n=1):
+        """
+        Record `n` rows tried at `depth` that covered `covers` columns
+        """
+        while len(self.nodes) <= depth:
+            self.nodes.append(0)
+        self.nodes[depth] += n
+        self.covers += covers
+
+    def snapshot(self):
+        return {'nodes': list(self.nodes),
+                'covers': self.covers,
+                'uncovers': self.uncovers,
+                'solutions': self.solutions,
+               }
+
+class SAMPLER(object):
+    """
+    A single background thread that calls `source()` (e.g., a solver's
+    `snapshot` method) every `every` seconds and emits the resulting dict,
+    along with the elapsed time and the memory used by this process, as a
+    JSON line appended to `path` and/or as the argument to `callback`.
+
+    A final sample is emitted when the sampler is stopped. Samplers are
+    context managers:
+
+        with dlx.sample(every=1.0, path='metrics.jsonl'):
+            dlx.count()
+    """
+
+    def __init__(self, source, every=60.0, path=None, callback=None):
+        self._source = source
+        self._every = every
+        self._path = path
+        self._callback = callback
+        self._fp = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._process = psutil.Process(os.getpid())
+        self._start_time = None
+
+    def sample(self):
+        """
+        Return one snapshot without emitting it
+        """
+        memory = self._process.memory_info()[0]
+        snapshot = {'elapsed': time.time() - self._start_time,
+                    'memory': memory / (1024.0 ** 3),
+                    'memory_percent': self._process.memory_percent(),
+                   }
+        snapshot.update(self._source())
+
+        return snapshot
+
+    def _emit(self):
+        snapshot = self.sample()
+        if self._fp is not None:
+            self._fp.write(json.dumps(snapshot) + '\n')
+            self._fp.flush()
+        if self._callback is not None:
+            self._callback(snapshot)
+
+    def _run(self):
+        # Wait until the next multiple of `every` to avoid drifting
+        while not self._stop.wait(self._every - (time.time() - self._start_time) % self._every):
+            self._emit()
+
+    def start(self):
+        self._start_time = time.time()
+        self._stop.clear()
+        if self._path is not None:
+            self._fp = open(self._path, 'a')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._emit()
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
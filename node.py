@@ -85,6 +85,7 @@ class COLUMN(ROOT):
     def __init__(self):
         super().__init__()
         self._up = self
+        self._down = self
         self._column = self
         self._size = None
         self._name = None
@@ -97,6 +98,14 @@ class COLUMN(ROOT):
     def U(self, value):
         self._up = value
 
+    @property
+    def D(self):
+        return self._down
+
+    @D.setter
+    def D(self, value):
+        self._down = value
+
     @property
     def column(self):
         return self._column
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from multiprocessing import Pool
+
+_solver = None  # Solver instance that is built once in each worker process
+
+def branches(solver, depth=1):
+    """
+    Expand the top `depth` levels of the search tree of `solver` (a `DLX` or
+    `DXZ` instance) and return the row prefix of every branch at that depth.
+
+    Prefixes that already are complete solutions above `depth` are returned
+    too, while dead ends (a column with no rows left) are dropped. The matrix
+    is left exactly as it was found.
+    """
+    m = solver.matrix
+    prefixes = []
+
+    def expand(prefix):
+        if m.R(m.h) == m.h or len(prefix) == depth:
+            prefixes.append(prefix)
+            return
+
+        c = solver._choose_column()
+        for r in list(m.sweep(c, 'D')):
+            row = m.row(r)
+            solver._cover_row(row)
+            expand(prefix + (row,))
+            solver._uncover_row(row)
+
+    expand(())
+
+    return prefixes
+
+def _init_worker(cls, A, kwargs):
+    global _solver
+    _solver = cls(A, **kwargs)
+
+def count_branch(prefix, limit=None):
+    """
+    Count the solutions below `prefix` in a worker process
+    """
+    _solver._cover_rows(prefix)
+    try:
+        n = sum(_solver._search(limit, materialize=False))
+    finally:
+        _solver._uncover_rows(prefix)
+
+    return prefix, n
+
+def solve_branch(prefix, limit=None):
+    """
+    Return the solutions below `prefix` in a worker process, without the
+    rows in `prefix`
+    """
+    _solver._cover_rows(prefix)
+    try:
+        sols = list(_solver._search(limit))
+    finally:
+        _solver._uncover_rows(prefix)
+
+    return prefix, sols
+
+def zdd_branch(prefix):
+    """
+    Return the ZDD below `prefix` in a worker process, as the arrays from
+    `ZDD.to_arrays` so that it can be sent back to the parent process
+    """
+    _solver._cover_rows(prefix)
+    try:
+        root = _solver._search()
+    finally:
+        _solver._uncover_rows(prefix)
+
+    return prefix, _solver.manager.to_arrays(root)
+
+def run(solver, task, processes=None, depth=1):
+    """
+    Hand every branch from `branches(solver, depth)` to `task` on a pool of
+    `processes` workers and return a generator of (prefix, result) pairs in
+    the order that the branches finish.
+
+    Each worker rebuilds the solver once from `solver._worker_args()` and
+    then pulls one branch at a time, so workers that draw small subtrees
+    simply take more of them. Closing the generator terminates the pool.
+    """
+    prefixes = branches(solver, depth)
+    cls, A, kwargs = solver._worker_args()
+    with Pool(processes, _init_worker, (cls, A, kwargs)) as pool:
+        for prefix, result in pool.imap_unordered(task, prefixes, chunksize=1):
+            yield prefix, result
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+import heapq
+from collections import deque
+import game
+import piece
+
+DIRECTIONS = {
+    'up': (-1, 0),
+    'down': (1, 0),
+    'left': (0, -1),
+    'right': (0, 1),
+}
+
+# Returned by `PUZZLE.solve` when it stops after `max_states` states, which
+# is not the same as None (no solution exists)
+GAVE_UP = 'gave up'
+
+class PUZZLE(object):
+    """
+    The sliding puzzle played on a `GAME` board: a move slides one piece one
+    cell up, down, left or right without rotating it, overlapping another
+    piece, or entering the exclusion zone, and the puzzle is solved once the
+    `target` piece covers the exit space.
+
+    A state is packed into a single int with a bit field per movable piece
+    that holds its position index (the index into `GAME._piece_rows`, where
+    0 is off of the board), so that states are cheap to hash and store. The
+    pieces in `fixed` (the white pieces by default) never move and only
+    block cells. Every position of every piece, its cell bitmask, and its
+    neighbouring positions are precomputed from the same `PIECE.ref_idx`
+    orientations and `row_placement` that `enumerate_positions` produces.
+    """
+
+    def __init__(self, g=None, target='red', fixed=None):
+        if g is None:
+            g = game.GAME()
+        if g.row_placement is None:
+            g.enumerate_positions()
+        if g.multiplicities is not None:
+            raise ValueError("Pieces that share a column cannot be moved individually")
+        if fixed is None:
+            fixed = [k for k, p in g.pieces.items() if isinstance(p, piece.WHITE)]
+
+        self._game = g
+        self._target = target
+        self._fixed = list(fixed)
+        self._movable = [k for k in g.pieces if k not in self._fixed]
+        self._exit = 1 << (g.n * g.m)
+        self._masks = {}  # Cell bitmask of each position index of each piece
+        self._neighbours = {}  # (direction, position index) of each one step move
+        self._shifts = {}
+        self._widths = {}
+
+        shift = 0
+        for k in g.pieces:
+            self._init_piece(k)
+            if k in self._movable:
+                width = max(1, (len(self._masks[k]) - 1).bit_length())
+                self._shifts[k] = shift
+                self._widths[k] = (1 << width) - 1
+                shift += width
+
+        masks = self._masks[target]
+        self._goals = {i for i, mask in enumerate(masks) if mask & self._exit}
+        self._distance = self._target_distances()
+
+    @property
+    def game(self):
+        return self._game
+
+    @property
+    def target(self):
+        return self._target
+
+    def _init_piece(self, k):
+        g = self._game
+        n, m = g.n, g.m
+        rows = g._piece_rows[k]
+        masks = [0]
+        index = {}
+        for i, row in enumerate(rows[1:], 1):
+            orientation, offset = g.row_placement[row].tolist()
+            r0, c0 = divmod(offset, m)
+            mask = 0
+            for r, c in g.pieces[k].ref_idx[orientation].tolist():
+                r, c = r + r0, c + c0
+                mask |= 1 << (r * m + c if r < n and c < m else n * m)
+            masks.append(mask)
+            index[orientation, r0, c0] = i
+
+        neighbours = [[] for _ in masks]
+        for (orientation, r0, c0), i in index.items():
+            for direction, (dr, dc) in DIRECTIONS.items():
+                j = index.get((orientation, r0 + dr, c0 + dc))
+                if j is not None:
+                    neighbours[i].append((direction, j))
+
+        self._masks[k] = masks
+        self._neighbours[k] = neighbours
+
+    def _target_distances(self):
+        """
+        Fewest moves from each position of the target to the exit on an
+        otherwise empty board, which never overestimates the moves left and
+        is the A* heuristic
+        """
+        neighbours = self._neighbours[self._target]
+        distance = [None] * len(neighbours)
+        queue = deque(self._goals)
+        for i in self._goals:
+            distance[i] = 0
+        while queue:
+            i = queue.popleft()
+            for _, j in neighbours[i]:
+                # Moves are reversible, so the graph is undirected
+                if distance[j] is None:
+                    distance[j] = distance[i] + 1
+                    queue.append(j)
+
+        return distance
+
+    def pack(self, rows):
+        """
+        Pack a start position, given as rows of `GAME.pieces_csc` with at
+        most one row per piece (pieces without a row are off of the board),
+        into a state. The cells of the fixed pieces are not part of the state,
+        so they are returned as a bitmask along with it, as (state, blocked),
+        to be passed to `moves`.
+        """
+        g = self._game
+        state = 0
+        blocked = 0
+        occupied = 0
+        seen = set()
+        for row in rows:
+            k, i = g.row_to_piece[row]
+            if k in seen:
+                raise ValueError(f"Piece '{k}' is placed more than once")
+            seen.add(k)
+            mask = self._masks[k][i]
+            if mask & occupied:
+                raise ValueError(f"Piece '{k}' overlaps another piece")
+            occupied |= mask
+            if k in self._shifts:
+                state |= i << self._shifts[k]
+            else:
+                blocked |= mask
+
+        return state, blocked
+
+    def unpack(self, state):
+        """
+        Return the {piece key: position index} of the movable pieces in
+        `state`
+        """
+        return {k: (state >> shift) & self._widths[k]
+                for k, shift in self._shifts.items()}
+
+    def rows(self, state):
+        """
+        Return the rows of `GAME.pieces_csc` for the movable pieces in
+        `state` that are on the board
+        """
+        piece_rows = self._game._piece_rows
+        return [piece_rows[k][i] for k, i in self.unpack(state).items() if i > 0]
+
+    def moves(self, state, blocked=0):
+        """
+        Returns a generator of (piece key, direction, next state) for every
+        legal move from `state`, where the fixed pieces cover the cells in
+        `blocked` (see `pack`)
+        """
+        positions = self.unpack(state)
+        occupied = blocked
+        for k, i in positions.items():
+            occupied |= self._masks[k][i]
+
+        for k, i in positions.items():
+            masks = self._masks[k]
+            others = occupied & ~masks[i]
+            shift = self._shifts[k]
+            for direction, j in self._neighbours[k][i]:
+                if not masks[j] & others:
+                    yield k, direction, state + ((j - i) << shift)
+
+    def is_goal(self, state):
+        return (state >> self._shifts[self._target]) & self._widths[self._target] in self._goals
+
+    def _heuristic(self, state):
+        i = (state >> self._shifts[self._target]) & self._widths[self._target]
+        return self._distance[i]
+
+    def solve(self, rows, method='astar', max_states=None):
+        """
+        Return a shortest list of (piece key, direction) moves that takes the
+        start position `rows` (see `pack`) to a solved state, None if there
+        is none, or `GAVE_UP` if more than `max_states` states (visited or
+        queued) would have to be stored. `method` is 'bfs' or 'astar' (with `_target_distances` as an
+        admissible heuristic, so both return a shortest solution). The
+        visited states are kept in a dict that maps each one to its parent
+        and the move that reached it.
+        """
+        if method not in ('bfs', 'astar'):
+            raise ValueError(f"Unknown method '{method}', expected 'bfs' or 'astar'")
+
+        start, blocked = self.pack(rows)
+        if method == 'bfs':
+            return self._bfs(start, blocked, max_states)
+
+        return self._astar(start, blocked, max_states)
+
+    def _path(self, parents, state):
+        path = []
+        while parents[state] is not None:
+            state, move = parents[state]
+            path.append(move)
+        path.reverse()
+
+        return path
+
+    def _bfs(self, start, blocked, max_states):
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            if self.is_goal(state):
+                return self._path(parents, state)
+            for k, direction, nxt in self.moves(state, blocked):
+                if nxt not in parents:
+                    parents[nxt] = (state, (k, direction))
+                    queue.append(nxt)
+            if max_states is not None and len(parents) > max_states:
+                return GAVE_UP
+
+        return None
+
+    def _astar(self, start, blocked, max_states):
+        h = self._heuristic(start)
+        if h is None:
+            return None
+
+        parents = {start: None}
+        cost = {start: 0}
+        heap = [(h, 0, start)]
+        while heap:
+            f, g, state = heapq.heappop(heap)
+            if g > cost[state]:
+                # Stale entry
+                continue
+            if self.is_goal(state):
+                return self._path(parents, state)
+            for k, direction, nxt in self.moves(state, blocked):
+                if nxt in cost and cost[nxt] <= g + 1:
+                    continue
+                h = self._heuristic(nxt)
+                if h is None:
+                    continue
+                cost[nxt] = g + 1
+                parents[nxt] = (state, (k, direction))
+                heapq.heappush(heap, (g + 1 + h, g + 1, nxt))
+            if max_states is not None and len(cost) > max_states:
+                return GAVE_UP
+
+        return None
+
+    def solve_batch(self, starts, method='astar', max_states=100000):
+        """
+        Returns a generator of the result of `solve` for each start position
+        in `starts`. Each start is searched on its own and its states are
+        dropped before the next one, so memory stays bounded by
+        `max_states` states no matter how many starts there are. Starts that
+        hit that bound give `GAVE_UP` rather than None.
+        """
+        for rows in starts:
+            yield self.solve(rows, method, max_states)
+
+if __name__ == '__main__':
+    g = game.GAME()
+    g.enumerate_positions()
+    puzzle = PUZZLE(g)
+    start = [g.position_rows('red', 0, 3, 1)[0],
+             g.position_rows('orange', 0, 0, 2)[0],
+             g.position_rows('white_1', 0, 2, 4)[0],
+            ]
+    print(puzzle.solve(start, 'bfs'))
+    print(puzzle.solve(start, 'astar'))
@@ -1,6 +1,3 @@
 #!/bin/sh
 
-conda install -y fastcache
-conda install -y bitarray
 conda install -y psutil
-pip install -y graphillion
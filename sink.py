@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+import abc
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+import zipfile
+import numpy as np
+
+class SINK(abc.ABC):
+    """
+    Base class for the destinations of a stream of solutions.
+
+    `write` appends a solution (a sequence of rows) to a buffer of `block`
+    solutions. A full buffer is handed to a single background thread that
+    passes it to `_flush` while the search continues, and at most `pending`
+    full buffers wait for that thread, so memory stays bounded even when
+    the solver outpaces the disk. Sinks are context managers, and `close`
+    flushes what is left and re-raises any error from the thread:
+
+        with NPZ_SINK('solutions.npz') as sink:
+            dlx.stream(sink)
+    """
+
+    def __init__(self, block=65536, pending=2):
+        self._block = block
+        self._buffer = []
+        self._queue = queue.Queue(pending)
+        self._error = None
+        self._count = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def count(self):
+        """
+        Number of solutions written so far
+        """
+        return self._count
+
+    def _run(self):
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if self._error is None:
+                try:
+                    self._flush(block)
+                except Exception as e:
+                    self._error = e
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, solution):
+        self._buffer.append(solution)
+        self._count += 1
+        if len(self._buffer) >= self._block:
+            self._check()
+            self._queue.put(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        if self._thread is None:
+            return
+
+        if self._buffer:
+            self._queue.put(self._buffer)
+            self._buffer = []
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._close()
+        self._check()
+
+    @abc.abstractmethod
+    def _flush(self, block):
+        """
+        Write a full block of solutions (called on the background thread)
+        """
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CALLBACK_SINK(SINK):
+    """
+    Pass each full block, as a list of solutions, to `callback` on the
+    background thread (e.g., `solutions.extend` to collect them in memory)
+    """
+
+    def __init__(self, callback, block=65536, pending=2):
+        self._callback = callback
+        super().__init__(block, pending)
+
+    def _flush(self, block):
+        self._callback(block)
+
+class NPZ_SINK(SINK):
+    """
+    Write every block to the `.npz` file at `path` as two arrays, the rows
+    of all of its solutions back to back (`rows_00000`, ...) and the offset
+    of each solution in them (`offsets_00000`, ...), without holding more
+    than one block in memory. Use `read_npz` to get the solutions back.
+    The arrays are deflated (like `np.savez_compressed`) unless `compress`
+    is False.
+    """
+
+    def __init__(self, path, block=65536, pending=2, dtype=np.int32, compress=True):
+        compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip = zipfile.ZipFile(path, 'w', compression, allowZip64=True)
+        self._dtype = dtype
+        self._n_blocks = 0
+        super().__init__(block, pending)
+
+    def _write_array(self, name, arr):
+        with self._zip.open(name + '.npy', 'w', force_zip64=True) as fp:
+            np.lib.format.write_array(fp, arr, allow_pickle=False)
+
+    def _flush(self, block):
+        sizes = np.fromiter((len(sol) for sol in block), dtype=np.int64, count=len(block))
+        offsets = np.zeros(len(block) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        rows = np.fromiter((row for sol in block for row in sol), dtype=self._dtype,
+                           count=offsets[-1])
+        self._write_array(f"rows_{self._n_blocks:05d}", rows)
+        self._write_array(f"offsets_{self._n_blocks:05d}", offsets)
+        self._n_blocks += 1
+
+    def _close(self):
+        self._zip.close()
+
+class DENSE_NPZ_SINK(NPZ_SINK):
+    """
+    Same as `NPZ_SINK` for solutions that all have the same number of rows
+    (e.g., one per piece), which are written to the `.npz` file as one
+    (n_solutions, n_rows) array per block (`block_00000`, ...)
+    """
+
+    def _flush(self, block):
+        self._write_array(f"block_{self._n_blocks:05d}", np.asarray(block, dtype=self._dtype))
+        self._n_blocks += 1
+
+def read_npz(path):
+    """
+    Returns a generator of the solutions, as tuples of rows, in a file
+    written by `NPZ_SINK` or `DENSE_NPZ_SINK`
+    """
+    with np.load(path) as npz:
+        # Blocks are numbered in the suffix of their names
+        names = sorted((name for name in npz.files if not name.startswith('offsets_')),
+                       key=lambda name: int(name.rsplit('_', 1)[1]))
+        for name in names:
+            if name.startswith('block_'):
+                for sol in npz[name].tolist():
+                    yield tuple(sol)
+            elif name.startswith('rows_'):
+                rows = npz[name].tolist()
+                offsets = npz['offsets_' + name[len('rows_'):]].tolist()
+                for start, stop in zip(offsets, offsets[1:]):
+                    yield tuple(rows[start:stop])
+
+_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+class LINE_SINK(SINK):
+    """
+    Write one line of space separated rows per solution to `path`, which is
+    compressed with gzip, bz2 or lzma when it ends in `.gz`, `.bz2` or `.xz`
+    """
+
+    def __init__(self, path, block=65536, pending=2):
+        opener = open
+        for ext, func in _OPENERS.items():
+            if path.endswith(ext):
+                opener = func
+        self._fp = opener(path, 'wt')
+        super().__init__(block, pending)
+
+    def _flush(self, block):
+        self._fp.write(''.join(' '.join(map(str, sol)) + '\n' for sol in block))
+
+    def _close(self):
+        self._fp.close()
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    sols = [(0, 3, 5), (1, 2), (4,)]
+    collected = []
+    with CALLBACK_SINK(collected.extend, block=2) as sink:
+        for sol in sols:
+            sink.write(sol)
+    print(collected)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'solutions.npz')
+        with NPZ_SINK(path, block=2) as sink:
+            for sol in sols:
+                sink.write(sol)
+        print(list(read_npz(path)))
+
+        with DENSE_NPZ_SINK(path, block=2) as sink:
+            for sol in [(0, 3), (1, 2), (4, 5)]:
+                sink.write(sol)
+        print(list(read_npz(path)))
+
+        path = os.path.join(tmp, 'solutions.txt.gz')
+        with LINE_SINK(path) as sink:
+            for sol in sols:
+                sink.write(sol)
+        with gzip.open(path, 'rt') as fp:
+            print(fp.read().splitlines())
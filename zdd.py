@@ -0,0 +1,618 @@
+#!/usr/bin/env python
+
+from array import array
+import json
+import mmap
+import random
+import struct
+import sys
+
+TERMINAL = 2**63 - 1  # Variable stored for both terminal nodes
+
+# Binary format: a 64 byte header, then the `var`, `lo` and `hi` arrays as
+# little endian int64 (terminals included), then a JSON metadata blob
+FORMAT_MAGIC = b'ZDDNODES'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sIIQQQQ16x')  # magic, version, 0, n_nodes, root, meta offset, meta length
+
+class ZDD(object):
+    """
+    Zero-suppressed decision diagram node manager.
+
+    Node 0 is the empty family and node 1 is the family that only contains
+    the empty set. Every other node is a (var, lo, hi) triple stored in flat
+    arrays and kept unique through a hash table, so equal families always
+    share the same node. Variables are row indices and increase from the
+    root toward the terminals.
+
+    Nodes are only ever created bottom-up (children before parents), which
+    is how Algorithm Z builds its solution, so node ids are also a
+    topological order. The `union` and `join` operations use an explicit
+    stack so that long chains of nodes do not hit the recursion limit, and
+    their operation caches (and the cache of `count`) are simply cleared
+    once they reach `cache_size`.
+    """
+
+    EMPTY = 0
+    BASE = 1
+
+    def __init__(self, cache_size=2**20):
+        self._var = array('q', [TERMINAL, TERMINAL])
+        self._lo = array('q', [0, 1])
+        self._hi = array('q', [0, 1])
+        self._unique = {}
+        self._cache_size = cache_size
+        self._union_cache = {}
+        self._join_cache = {}
+        self._count_cache = {}
+
+    def __len__(self):
+        """
+        Number of nodes, including the two terminals
+        """
+        return len(self._var)
+
+    def var(self, n):
+        return self._var[n]
+
+    def lo(self, n):
+        return self._lo[n]
+
+    def hi(self, n):
+        return self._hi[n]
+
+    def node(self, var, lo, hi):
+        """
+        Return the unique node for (var, lo, hi), applying the
+        zero-suppression rule
+        """
+        if hi == self.EMPTY:
+            return lo
+
+        key = (var, lo, hi)
+        n = self._unique.get(key)
+        if n is None:
+            n = len(self._var)
+            self._var.append(var)
+            self._lo.append(lo)
+            self._hi.append(hi)
+            self._unique[key] = n
+
+        return n
+
+    def singleton(self, var):
+        """
+        Return the family {{var}}
+        """
+        return self.node(var, self.EMPTY, self.BASE)
+
+    def _cached(self, cache, key, value):
+        if len(cache) >= self._cache_size:
+            cache.clear()
+        cache[key] = value
+
+    def union(self, a, b):
+        """
+        Return the family of sets that are in `a` or in `b`
+        """
+        var, lo, hi = self._var, self._lo, self._hi
+        cache = self._union_cache
+        out = []
+        todo = [(a, b, False)]
+        while todo:
+            a, b, expanded = todo.pop()
+            if expanded:
+                r_hi = out.pop()
+                r_lo = out.pop()
+                r = self.node(min(var[a], var[b]), r_lo, r_hi)
+                self._cached(cache, (a, b), r)
+                out.append(r)
+                continue
+
+            if a == b or b == self.EMPTY:
+                out.append(a)
+                continue
+            if a == self.EMPTY:
+                out.append(b)
+                continue
+            if a > b:
+                a, b = b, a
+            r = cache.get((a, b))
+            if r is not None:
+                out.append(r)
+                continue
+
+            todo.append((a, b, True))
+            if var[a] < var[b]:
+                todo.append((hi[a], self.EMPTY, False))
+                todo.append((lo[a], b, False))
+            elif var[a] > var[b]:
+                todo.append((hi[b], self.EMPTY, False))
+                todo.append((a, lo[b], False))
+            else:
+                todo.append((hi[a], hi[b], False))
+                todo.append((lo[a], lo[b], False))
+
+        return out.pop()
+
+    def join(self, a, b):
+        """
+        Return the family of unions of one set from `a` and one set from `b`
+        """
+        var, lo, hi = self._var, self._lo, self._hi
+        cache = self._join_cache
+        out = []
+        todo = [(a, b, False)]
+        while todo:
+            a, b, expanded = todo.pop()
+            if expanded:
+                if var[a] == var[b]:
+                    r_hi = self.union(out.pop(), self.union(out.pop(), out.pop()))
+                else:
+                    r_hi = out.pop()
+                r_lo = out.pop()
+                r = self.node(min(var[a], var[b]), r_lo, r_hi)
+                self._cached(cache, (a, b), r)
+                out.append(r)
+                continue
+
+            if a == self.EMPTY or b == self.EMPTY:
+                out.append(self.EMPTY)
+                continue
+            if a == self.BASE:
+                out.append(b)
+                continue
+            if b == self.BASE:
+                out.append(a)
+                continue
+            if a > b:
+                a, b = b, a
+            r = cache.get((a, b))
+            if r is not None:
+                out.append(r)
+                continue
+
+            todo.append((a, b, True))
+            if var[a] < var[b]:
+                todo.append((hi[a], b, False))
+                todo.append((lo[a], b, False))
+            elif var[a] > var[b]:
+                todo.append((a, hi[b], False))
+                todo.append((a, lo[b], False))
+            else:
+                todo.append((lo[a], hi[b], False))
+                todo.append((hi[a], lo[b], False))
+                todo.append((hi[a], hi[b], False))
+                todo.append((lo[a], lo[b], False))
+
+        return out.pop()
+
+    def _subset(self, n, v, keep):
+        """
+        Return the sets of the family rooted at `n` that contain `v` (with
+        `keep=True`) or that do not. Only the nodes above variable `v` are
+        visited since variables increase toward the terminals.
+        """
+        var, lo, hi = self._var, self._lo, self._hi
+        memo = {}
+        out = []
+        todo = [(n, False)]
+        while todo:
+            x, expanded = todo.pop()
+            if expanded:
+                r_hi = out.pop()
+                r_lo = out.pop()
+                r = self.node(var[x], r_lo, r_hi)
+                memo[x] = r
+                out.append(r)
+                continue
+
+            if x <= self.BASE or var[x] > v:
+                out.append(self.EMPTY if keep else x)
+            elif var[x] == v:
+                out.append(self.node(v, self.EMPTY, hi[x]) if keep else lo[x])
+            elif x in memo:
+                out.append(memo[x])
+            else:
+                todo.append((x, True))
+                todo.append((hi[x], False))
+                todo.append((lo[x], False))
+
+        return out.pop()
+
+    def onset(self, n, v):
+        """
+        Return the sets of the family rooted at `n` that contain `v`
+        """
+        return self._subset(n, v, True)
+
+    def offset(self, n, v):
+        """
+        Return the sets of the family rooted at `n` that do not contain `v`
+        """
+        return self._subset(n, v, False)
+
+    def restrict(self, n, required=(), forbidden=(), any_of=()):
+        """
+        Return the sets of the family rooted at `n` that contain every
+        variable in `required`, none in `forbidden`, and at least one
+        variable from each collection in `any_of`
+        """
+        for v in forbidden:
+            n = self.offset(n, v)
+        for v in required:
+            n = self.onset(n, v)
+        for group in any_of:
+            x = self.EMPTY
+            for v in set(group):
+                x = self.union(x, self.onset(n, v))
+            n = x
+
+        return n
+
+    def count(self, n):
+        """
+        Return the exact number of sets in the family rooted at node `n`
+        """
+        lo, hi = self._lo, self._hi
+        cache = self._count_cache
+        if n not in cache and len(cache) >= self._cache_size:
+            cache.clear()
+        cache[self.EMPTY] = 0
+        cache[self.BASE] = 1
+        todo = [n]
+        while todo:
+            x = todo[-1]
+            if x in cache:
+                todo.pop()
+                continue
+            l, h = lo[x], hi[x]
+            if l in cache and h in cache:
+                cache[x] = cache[l] + cache[h]
+                todo.pop()
+            else:
+                if l not in cache:
+                    todo.append(l)
+                if h not in cache:
+                    todo.append(h)
+
+        return cache[n]
+
+    def iter_sets(self, n):
+        """
+        Returns a generator of every set in the family rooted at node `n`,
+        as a tuple of increasing variables
+        """
+        var, lo, hi = self._var, self._lo, self._hi
+        todo = [(n, ())]
+        while todo:
+            x, path = todo.pop()
+            while x > self.BASE:
+                todo.append((lo[x], path))
+                path = path + (var[x],)
+                x = hi[x]
+            if x == self.BASE:
+                yield path
+
+    def unrank(self, n, i):
+        """
+        Return the set with index `i` (0 to count(n) - 1) in the order of
+        `iter_sets`, where the sets that contain the root's variable come
+        first. This follows one path from `n` to a terminal, choosing the hi
+        child when `i` falls within its count.
+        """
+        total = self.count(n)
+        if not 0 <= i < total:
+            raise IndexError(f"Index {i} is out of range for a family of {total} sets")
+
+        var, lo, hi = self._var, self._lo, self._hi
+        cache = self._count_cache
+        path = []
+        x = n
+        while x > self.BASE:
+            h = cache[hi[x]]
+            if i < h:
+                path.append(var[x])
+                x = hi[x]
+            else:
+                i -= h
+                x = lo[x]
+
+        return tuple(path)
+
+    def rank(self, n, s):
+        """
+        Return the index of the set `s` in the order of `iter_sets`, so that
+        `unrank(n, rank(n, s)) == tuple(sorted(s))`, or raise a ValueError if
+        `s` is not in the family rooted at `n`
+        """
+        self.count(n)
+        var, lo, hi = self._var, self._lo, self._hi
+        cache = self._count_cache
+        todo = sorted(s)
+        i = 0
+        k = 0
+        x = n
+        while x > self.BASE:
+            if k < len(todo) and todo[k] < var[x]:
+                break
+            if k < len(todo) and todo[k] == var[x]:
+                k += 1
+                x = hi[x]
+            else:
+                i += cache[hi[x]]
+                x = lo[x]
+
+        if x != self.BASE or k != len(todo):
+            raise ValueError(f"{tuple(todo)} is not in the family")
+
+        return i
+
+    def sample(self, n, k, seed=None):
+        """
+        Return `k` distinct sets drawn uniformly at random from the family
+        rooted at `n`, each found with `unrank`. Indices are drawn with
+        `random.sample`, or for families too large for it (more than 2**63
+        sets) with `randrange`, redrawing any repeats.
+        """
+        total = self.count(n)
+        if not 0 <= k <= total:
+            raise ValueError(f"Cannot sample {k} sets from a family of {total} sets")
+
+        rng = random.Random(seed)
+        if total <= sys.maxsize:
+            return [self.unrank(n, i) for i in rng.sample(range(total), k)]
+
+        seen = set()
+        indices = []
+        while len(indices) < k:
+            i = rng.randrange(total)
+            if i not in seen:
+                seen.add(i)
+                indices.append(i)
+
+        return [self.unrank(n, i) for i in indices]
+
+    def clear_caches(self):
+        """
+        Release the operation caches (the nodes themselves are kept)
+        """
+        self._union_cache = {}
+        self._join_cache = {}
+        self._count_cache = {}
+
+    def dump(self, fp, root):
+        """
+        Write the nodes reachable from `root` to the text file object, `fp`,
+        one "id var lo hi" line per node from the bottom up, followed by the
+        root id
+        """
+        for x in self.reachable(root):
+            fp.write(f"{x} {self._var[x]} {self._lo[x]} {self._hi[x]}\n")
+        fp.write(f"{root}\n")
+
+    def load(self, fp):
+        """
+        Read nodes written by `dump` from the text file object, `fp`, and
+        return the new id of the root
+        """
+        ids = {self.EMPTY: self.EMPTY, self.BASE: self.BASE}
+        for line in fp:
+            fields = line.split()
+            if len(fields) == 1:
+                return ids[int(fields[0])]
+            x, var, lo, hi = map(int, fields)
+            ids[x] = self.node(var, ids[lo], ids[hi])
+
+    def write(self, fp, root, meta=None):
+        """
+        Write the nodes reachable from `root` to the binary file object, `fp`,
+        in the format that `MAPPED_ZDD` reads, along with the JSON-able `meta`
+        """
+        var, lo, hi, roots = self.export([root])
+        n_nodes = len(var) + 2
+        blob = json.dumps(meta).encode()
+        fp.write(_HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, 0, n_nodes, roots[0],
+                              _HEADER.size + 3 * 8 * n_nodes, len(blob)))
+        for values, terminals in ((var, [TERMINAL, TERMINAL]), (lo, [0, 1]), (hi, [0, 1])):
+            arr = array('q', terminals)
+            arr.extend(values)
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            fp.write(arr.tobytes())
+        fp.write(blob)
+
+    def to_arrays(self, root):
+        """
+        Return the nodes reachable from `root` as `var`, `lo`, and `hi` lists
+        that are renumbered bottom-up starting at 2 (after the terminals),
+        along with the new id of the root
+        """
+        var, lo, hi, roots = self.export([root])
+
+        return var, lo, hi, roots[0]
+
+    def export(self, roots):
+        """
+        Same as `to_arrays` but for the nodes reachable from any of `roots`,
+        returning the list of new root ids
+        """
+        nodes = self.reachable(*roots)
+        ids = {self.EMPTY: self.EMPTY, self.BASE: self.BASE}
+        for i, x in enumerate(nodes):
+            ids[x] = i + 2
+        var = [self._var[x] for x in nodes]
+        lo = [ids[self._lo[x]] for x in nodes]
+        hi = [ids[self._hi[x]] for x in nodes]
+
+        return var, lo, hi, [ids[root] for root in roots]
+
+    def from_arrays(self, var, lo, hi, root):
+        """
+        Add nodes produced by `to_arrays` (possibly from another manager) to
+        this manager and return the new id of the root
+        """
+        return self.import_(var, lo, hi, [root])[0]
+
+    def import_(self, var, lo, hi, roots):
+        """
+        Add nodes produced by `export` to this manager and return the new ids
+        of `roots`
+        """
+        ids = [self.EMPTY, self.BASE]
+        for v, l, h in zip(var, lo, hi):
+            ids.append(self.node(int(v), ids[l], ids[h]))
+
+        return [ids[root] for root in roots]
+
+    def reachable(self, *roots):
+        """
+        Return the ids of the non-terminal nodes reachable from `roots`, in
+        increasing (bottom-up) order
+        """
+        lo, hi = self._lo, self._hi
+        seen = set()
+        todo = list(roots)
+        while todo:
+            x = todo.pop()
+            if x > self.BASE and x not in seen:
+                seen.add(x)
+                todo.append(lo[x])
+                todo.append(hi[x])
+
+        return sorted(seen)
+
+class MAPPED_ZDD(ZDD):
+    """
+    Read-only node manager over a file written by `ZDD.write`.
+
+    The node arrays are memory mapped rather than parsed, so opening a file
+    is O(1) and `count`, `iter_sets` and the other queries only page in the
+    nodes that they visit. The file's root is `root` and its metadata is
+    `meta`. New nodes cannot be created, so a `restrict` must be done on a
+    `ZDD` that the nodes are imported into (see `from_arrays`).
+    """
+
+    def __init__(self, path, cache_size=2**20):
+        super().__init__(cache_size)
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = _HEADER.unpack_from(self._mmap)
+        except struct.error:
+            header = (None, None, 0, 0, 0, 0, 0)
+        magic, version, _, n_nodes, root, meta_offset, meta_len = header
+        if magic != FORMAT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a binary ZDD file")
+        if version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+        if sys.byteorder != 'little':
+            self._mmap.close()
+            raise ValueError("Memory mapping binary ZDD files requires a little endian machine")
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        arrays = []
+        for _ in range(3):
+            arrays.append(view[offset:offset + 8 * n_nodes].cast('q'))
+            offset += 8 * n_nodes
+        self._var, self._lo, self._hi = arrays
+        self._root = root
+        self._meta = json.loads(bytes(view[meta_offset:meta_offset + meta_len]))
+        view.release()
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def meta(self):
+        return self._meta
+
+    def node(self, var, lo, hi):
+        if hi == self.EMPTY:
+            return lo
+        raise ValueError("A memory mapped ZDD is read-only")
+
+    def close(self):
+        for arr in (self._var, self._lo, self._hi):
+            arr.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FAMILY(object):
+    """
+    A family of sets given by a `root` node in a `ZDD` node manager
+    """
+
+    def __init__(self, zdd, root):
+        self._zdd = zdd
+        self._root = root
+
+    @property
+    def zdd(self):
+        return self._zdd
+
+    @property
+    def root(self):
+        return self._root
+
+    def count(self):
+        """
+        Number of sets in the family, which can be far larger than `len`
+        allows
+        """
+        return self._zdd.count(self._root)
+
+    def __iter__(self):
+        return self._zdd.iter_sets(self._root)
+
+    def __getitem__(self, i):
+        return self._zdd.unrank(self._root, i)
+
+    def unrank(self, i):
+        return self._zdd.unrank(self._root, i)
+
+    def rank(self, s):
+        return self._zdd.rank(self._root, s)
+
+    def sample(self, k, seed=None):
+        return self._zdd.sample(self._root, k, seed)
+
+    def restrict(self, required=(), forbidden=(), any_of=()):
+        return FAMILY(self._zdd, self._zdd.restrict(self._root, required, forbidden, any_of))
+
+    def __eq__(self, other):
+        return self._zdd is other.zdd and self._root == other.root
+
+    def __hash__(self):
+        return hash((id(self._zdd), self._root))
+
+    def union(self, other):
+        return FAMILY(self._zdd, self._zdd.union(self._root, other.root))
+
+    def join(self, other):
+        return FAMILY(self._zdd, self._zdd.join(self._root, other.root))
+
+if __name__ == '__main__':
+    zdd = ZDD()
+    a = zdd.union(zdd.singleton(1), zdd.singleton(2))  # {{1}, {2}}
+    b = zdd.union(zdd.singleton(3), zdd.BASE)  # {{3}, {}}
+    family = FAMILY(zdd, a).join(FAMILY(zdd, b))
+    print(family.count(), sorted(family))
+    print(family.unrank(2), family.rank((2, 3)), family.sample(2, seed=0))
+    print(sorted(family.restrict(required=[3], forbidden=[1])))
+
+    import tempfile
+    with tempfile.NamedTemporaryFile(suffix='.zdd') as fp:
+        zdd.write(fp, family.root)
+        fp.flush()
+        with MAPPED_ZDD(fp.name) as mapped:
+            print(mapped.count(mapped.root), sorted(mapped.iter_sets(mapped.root)))